@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import aiohttp
+
+# Result of one fetch; text is None and error is set when every attempt failed
+FetchResult = namedtuple('FetchResult', ['url', 'status', 'text', 'error'])
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        """
+        Per-host rate limiter: tokens refill at `rate` per second up to `capacity`,
+        and every request takes one.
+
+        Args:
+            rate (float): Requests per second; 0 or None disables limiting
+            capacity (int): Burst size
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        if not self.rate:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncFetcher:
+    def __init__(self, max_concurrency=50, per_host_concurrency=4, rate_per_host=None, burst=1,
+                 timeout=30, max_retries=3, backoff_base=0.5, max_backoff=30, headers=None,
+                 executor=None):
+        """
+        asyncio fetch engine shared by the scrapers.
+
+        Up to max_concurrency requests are in flight overall and per_host_concurrency
+        per host (enforced by the aiohttp connector). Each host also has a token bucket
+        of rate_per_host requests per second. Requests that time out, fail to connect or
+        answer 429/5xx are retried with exponential backoff plus jitter, and a
+        Retry-After header is honoured. Page handlers (parsing, PDF rendering) run in
+        `executor`, so the event loop keeps fetching while they work.
+
+        Args:
+            max_concurrency (int): Requests in flight across all hosts
+            per_host_concurrency (int): Requests in flight per host
+            rate_per_host (float): Requests per second per host (None: unlimited)
+            burst (int): Token bucket capacity per host
+            timeout (float): Total timeout per request in seconds
+            max_retries (int): Retries after the first attempt
+            backoff_base (float): First backoff delay in seconds, doubled per retry
+            max_backoff (float): Upper bound for one backoff delay
+            headers (dict): Headers sent with every request
+            executor: Executor for page handlers; defaults to a thread pool sized to
+                the CPU count. Pass a ProcessPoolExecutor for picklable handlers to
+                render PDFs outside the GIL.
+        """
+        self.max_concurrency = max_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.headers = headers or {}
+        self.executor = executor
+        self._buckets = {}
+
+    def _bucket(self, url):
+        host = urlparse(url).netloc
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate_per_host, self.burst)
+        return self._buckets[host]
+
+    def _backoff(self, attempt, retry_after=None):
+        """Delay before retry number `attempt` (0-based)."""
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass  # An HTTP date; fall back to exponential backoff
+        delay = min(self.backoff_base * 2 ** attempt, self.max_backoff)
+        return delay * (0.5 + random.random() / 2)
+
+    async def fetch(self, session, url):
+        """Fetch one URL with rate limiting and retries."""
+        error = None
+        for attempt in range(self.max_retries + 1):
+            await self._bucket(url).acquire()
+            try:
+                async with session.get(url, headers=self.headers) as response:
+                    if response.status not in RETRY_STATUSES or attempt == self.max_retries:
+                        text = await response.text(errors='replace')
+                        return FetchResult(url, response.status, text, None)
+                    # Only read the backoff here; the sleep happens once the response
+                    # and its connection are released
+                    delay = self._backoff(attempt, response.headers.get('Retry-After'))
+                    logging.warning(f"{url} returned {response.status}; retrying in {delay:.1f}s")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+                if attempt == self.max_retries:
+                    break
+                delay = self._backoff(attempt)
+                logging.warning(f"Error fetching {url}: {error}; retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        return FetchResult(url, None, None, error)
+
+    async def _process(self, session, url, depth, handle_page):
+        """Fetch a page and hand it to the handler in the executor; returns new links."""
+        result = await self.fetch(session, url)
+        if result.text is None or result.status != 200:
+            logging.error(f"Failed to fetch {url}: {result.error or result.status}")
+            return []
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, handle_page, url, depth, result.text) or []
+
+    async def crawl(self, frontier, handle_page, max_pages, accept=None):
+        """
+        Crawl from `frontier` until it is empty or max_pages pages were fetched.
+
+        Args:
+            frontier (CrawlFrontier): URLs to crawl; new links are pushed back onto it
+            handle_page: handle_page(url, depth, html) -> [(url, depth), ...], run
+                in the executor
+            max_pages (int): Maximum number of pages to fetch
+            accept: Optional accept(url, depth) -> bool checked before fetching
+
+        Returns:
+            int: Number of pages fetched
+        """
+        # Buckets hold asyncio locks, which belong to the event loop of this run
+        self._buckets = {}
+        own_executor = self.executor is None
+        if own_executor:
+            self.executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=self.per_host_concurrency)
+        pending = set()
+        submitted = 0
+        try:
+            async with aiohttp.ClientSession(connector=connector, timeout=self.timeout) as session:
+                while frontier or pending:
+                    while frontier and len(pending) < self.max_concurrency and submitted < max_pages:
+                        url, depth = frontier.pop()
+                        if accept is not None and not accept(url, depth):
+                            continue
+                        pending.add(asyncio.create_task(self._process(session, url, depth, handle_page)))
+                        submitted += 1
+                    if not pending:
+                        break
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        try:
+                            frontier.extend(task.result())
+                        except Exception as e:
+                            logging.error(f"Page handler failed: {str(e)}")
+                    logging.info(f"Fetched: {submitted - len(pending)} | In flight: {len(pending)} | "
+                                 f"Queue: {len(frontier)}")
+        finally:
+            if own_executor:
+                self.executor.shutdown()
+                self.executor = None
+        return submitted
+
+    def run(self, frontier, handle_page, max_pages, accept=None):
+        """Blocking wrapper around crawl() for synchronous callers."""
+        return asyncio.run(self.crawl(frontier, handle_page, max_pages, accept))
@@ -1,145 +1,1527 @@
+from __future__ import annotations
+
 import os
+import importlib.util
+import time
+import tempfile
+import shutil
+import contextlib
+import queue
+import threading
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 from tqdm.auto import tqdm
 from pathlib import Path
+import hashlib
 import pickle
-from scipy.cluster.hierarchy import dendrogram, linkage, fcluster
-from sklearn.metrics.pairwise import cosine_similarity
-import networkx as nx
-from matplotlib.colors import LinearSegmentedColormap
-import umap
-from typing import List, Dict, Tuple, Set
-
-# LangChain imports
-from langchain.document_loaders import DirectoryLoader, TextLoader
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores import FAISS
-from langchain.docstore.document import Document
+import json
+import zlib
+import sqlite3
+from typing import List, Dict, Tuple, Set, Optional, NamedTuple, Callable, Iterable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from scipy import sparse
+    from langchain.embeddings import HuggingFaceEmbeddings
+    from langchain.docstore.document import Document
+    from langchain.vectorstores import FAISS
+
+# Optional: lets blocked similarity control the number of BLAS threads
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+# Heavy dependencies (pandas, scipy, sklearn, faiss, LangChain, plotting, UMAP) are
+# imported inside the functions that use them, so a CLI subcommand only pays for the
+# stages it runs.
 
 # Set up constants
 DOCUMENT_DIR = "path/to/your/documents"  # Update this to your documents directory
-EMBEDDING_CACHE_PATH = "document_embeddings.pkl"
+DOCUMENT_GLOB = "**/*.txt"  # Update pattern based on your file types
+N_WORKERS = os.cpu_count() or 1  # Processes used for loading and chunking
+STREAM_QUEUE_SIZE = 8  # Chunk batches buffered between loading and embedding in streaming mode
+DOC_INDEX_HNSW_MIN = 100_000  # Use an HNSW document index (instead of exact) from this many documents
+QUERY_TOP_K = 10  # Nearest documents returned by the query API
+QUERY_PORT = 8765  # Port for the HTTP query server
+EMBEDDING_STORE_DIR = "embedding_store"  # Memory-mapped document embedding matrix
+EMBEDDING_STORAGE_DTYPE = "float32"  # Cache, stores and indexes: "float32", "float16", "int8" (per-row scaled) or "pq" (float16, PQ doc index)
+PQ_SUBQUANTIZERS = 96  # Sub-vectors per embedding for the product-quantized document index
+QUANTIZATION_EVAL_SAMPLE = 2000  # Documents sampled for the quantization recall check
 CHUNK_SIZE = 1000  # Characters per chunk
 CHUNK_OVERLAP = 200
 SIMILARITY_THRESHOLD = 0.85  # Minimum similarity to consider documents as similar
+SIMILARITY_MODE = "dense"  # "dense" (full n x n matrix), "ann" (FAISS) or "blocked" (exact, tiled)
+SIMILARITY_BLOCK_SIZE = 4096  # Rows/columns per tile in "blocked" mode
+MAX_EDGES_IN_MEMORY = 50_000_000  # Buffered edges before "blocked" mode spills to disk
+CLUSTERING_BACKEND = "hierarchical"  # "hierarchical" (scipy, O(n^2)), "knn_graph" or "birch"
+CLUSTER_KNN_K = 15  # Neighbours per document in the "knn_graph" backend
+CLUSTER_KNN_SIMILARITY = 0.5  # Minimum similarity for a k-NN edge to count
+CLUSTER_BIRCH_THRESHOLD = 0.5  # Subcluster radius for the "birch" backend (on normalized vectors)
+CLUSTER_BATCH_SIZE = 10_000  # Rows fed to the streaming clusterer per partial_fit
+ANN_TOP_K = 50  # Neighbours retrieved per document in "ann" mode
+ANN_HNSW_M = 32  # HNSW graph degree for the document-level ANN index
 EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"  # BERT-based model
+EMBEDDING_BATCH_SIZE = 256  # Chunks sent to the embedding model per call
+EMBEDDING_BACKEND = "huggingface"  # "huggingface" (in-process), "cpu_pool" (one model per worker) or "hashing" (tests)
+EMBEDDING_DEVICE = "cpu"  # Device of the in-process model ("cpu", "cuda", ...); "cpu_pool" workers always use CPU
+EMBEDDING_MAX_SEQ_LENGTH = None  # Token limit per chunk (None keeps the model's own limit)
+EMBEDDING_THREADS = None  # Torch threads per model copy (None: all cores in-process, cores / workers in a pool)
+EMBEDDING_POOL_WORKERS = max(1, (os.cpu_count() or 1) // 4)  # Model copies in the "cpu_pool" backend
+SHINGLE_SIZE = 5  # Words per shingle for MinHash near-duplicate detection
+MINHASH_PERMUTATIONS = 128  # MinHash signature length
+MINHASH_BANDS = 32  # LSH bands (MINHASH_PERMUTATIONS / MINHASH_BANDS rows per band)
+NEAR_DUPLICATE_THRESHOLD = 0.8  # Minimum estimated Jaccard similarity for lexical near-duplicates
+PASSAGE_SIMILARITY_THRESHOLD = 0.9  # Minimum chunk similarity to report a shared passage
+NETWORK_MAX_RENDER_NODES = 50_000  # Above this the duplicate network is only exported, not drawn
+UMAP_MAX_FIT_SIZE = 50_000  # Fit UMAP on a random sample of this many documents, transform the rest
+HEATMAP_TILES = 200  # Tiles per side of the aggregated similarity heatmap
+EXPORT_BATCH_ROWS = 500_000  # Rows per batch written by export_results
+EXCEL_MAX_ROWS = 1_048_575  # Excel's sheet limit minus the header row
+
+class ChunkRecord(NamedTuple):
+    """Compact chunk produced by a splitting worker."""
+    text: str
+    source: str
+    offset: int  # Character offset of the chunk in its source document
+
+def _read_document(path: str) -> Tuple[str, str]:
+    """Read one text file; runs in a worker process."""
+    with open(path, encoding='utf-8', errors='replace') as f:
+        return path, f.read()
+
+def _split_document(args: Tuple[str, str, int, int]) -> List[ChunkRecord]:
+    """Split one document into chunk records; runs in a worker process."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    source, text, chunk_size, chunk_overlap = args
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", ".", " ", ""],
+        add_start_index=True
+    )
+    return [ChunkRecord(chunk.page_content, source, chunk.metadata.get('start_index', -1))
+            for chunk in text_splitter.create_documents([text])]
+
+def _load_and_split(args: Tuple[str, int, int]) -> Tuple[str, str, List[ChunkRecord]]:
+    """Read and split one file, returning its normalized-text hash too; runs in a worker process."""
+    path, chunk_size, chunk_overlap = args
+    _, text = _read_document(path)
+    text_hash = hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+    return path, text_hash, _split_document((path, text, chunk_size, chunk_overlap))
+
+def parallel_map(func: Callable, items: List, n_workers: int = N_WORKERS,
+                 chunksize: int = 16, max_pending: Optional[int] = None) -> Iterable:
+    """
+    Map func over items in a process pool, yielding results in input order so runs are
+    reproducible. Falls back to a plain map for a single worker.
+    With max_pending, at most that many tasks are in flight or finished-but-unconsumed,
+    so a slow consumer throttles the pool instead of results piling up in memory.
+    """
+    if n_workers <= 1 or len(items) <= 1:
+        yield from map(func, items)
+        return
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        if max_pending is None:
+            yield from executor.map(func, items, chunksize=chunksize)
+            return
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _set_torch_threads(threads: Optional[int]):
+    """Limit intra-op threads of the torch runtime, if torch is installed."""
+    if not threads:
+        return
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+
+def _sentence_transformer(model_name: str, max_seq_length: Optional[int],
+                          device: str = EMBEDDING_DEVICE,
+                          batch_size: int = EMBEDDING_BATCH_SIZE) -> HuggingFaceEmbeddings:
+    """
+    HuggingFaceEmbeddings on the given device, encoding batch_size chunks per forward
+    pass, with an optional token limit per chunk.
+    """
+    from langchain.embeddings import HuggingFaceEmbeddings
+    model = HuggingFaceEmbeddings(model_name=model_name, model_kwargs={'device': device},
+                                  encode_kwargs={'batch_size': batch_size})
+    if max_seq_length:
+        model.client.max_seq_length = max_seq_length
+    return model
+
+class EmbeddingBackend:
+    """
+    Base class for chunk embedding backends. Subclasses implement _embed_batch; the base
+    class splits inputs into batches of batch_size and keeps throughput statistics.
+    Backends expose embed_documents/embed_query, so they can be passed wherever a
+    LangChain embeddings object is expected (FAISS.from_embeddings, load_local).
+    """
+    def __init__(self, batch_size: int = EMBEDDING_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.chunks_embedded = 0
+        self.seconds = 0.0
+    
+    @property
+    def cache_key(self) -> str:
+        """Identifies the vectors this backend produces in the EmbeddingCache."""
+        raise NotImplementedError
+    
+    @property
+    def parallelism(self) -> int:
+        """Batches the backend can embed at once; callers send this many batches per call."""
+        return 1
+    
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks_embedded / self.seconds if self.seconds else 0.0
+    
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+    
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts batch by batch; the pool backend overrides this to shard across workers."""
+        return np.vstack([self._embed_batch(texts[start:start + self.batch_size])
+                          for start in range(0, len(texts), self.batch_size)])
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        start_time = time.perf_counter()
+        vectors = self._embed(list(texts))
+        self.seconds += time.perf_counter() - start_time
+        self.chunks_embedded += len(texts)
+        return vectors.tolist()
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_batch([text])[0].tolist()
+    
+    def report_throughput(self):
+        if self.chunks_embedded:
+            print(f"Embedded {self.chunks_embedded} chunks in {self.seconds:.1f}s "
+                  f"({self.chunks_per_second:.1f} chunks/sec)")
+    
+    def close(self):
+        pass
+
+class HuggingFaceBackend(EmbeddingBackend):
+    """In-process sentence-transformers model on device (EMBEDDING_DEVICE, CPU by default)."""
+    def __init__(self, model_name: str = EMBEDDING_MODEL, batch_size: int = EMBEDDING_BATCH_SIZE,
+                 max_seq_length: Optional[int] = EMBEDDING_MAX_SEQ_LENGTH,
+                 threads: Optional[int] = EMBEDDING_THREADS, device: str = EMBEDDING_DEVICE):
+        super().__init__(batch_size)
+        self.model_name = model_name
+        self.max_seq_length = max_seq_length
+        _set_torch_threads(threads)
+        self.model = _sentence_transformer(model_name, max_seq_length, device, batch_size)
+    
+    @property
+    def cache_key(self) -> str:
+        return self.model_name if not self.max_seq_length else f"{self.model_name}@{self.max_seq_length}"
+    
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(self.model.embed_documents(texts), dtype=np.float32)
+
+# Model copy held by each worker of a CPUPoolBackend
+_worker_model = None
+
+def _init_embedding_worker(model_name: str, max_seq_length: Optional[int], threads: Optional[int],
+                           batch_size: int):
+    global _worker_model
+    _set_torch_threads(threads)
+    _worker_model = _sentence_transformer(model_name, max_seq_length, 'cpu', batch_size)
+
+def _embed_shard(texts: List[str]) -> np.ndarray:
+    """Embed one shard of chunks with the worker's model; runs in a worker process."""
+    return np.asarray(_worker_model.embed_documents(texts), dtype=np.float32)
+
+class CPUPoolBackend(HuggingFaceBackend):
+    """
+    Shards chunks across a pool of worker processes, each holding one model copy with
+    threads torch threads, so several models run side by side on CPU-only machines.
+    Shards are batch_size chunks; results come back in input order.
+    """
+    def __init__(self, model_name: str = EMBEDDING_MODEL, batch_size: int = EMBEDDING_BATCH_SIZE,
+                 max_seq_length: Optional[int] = EMBEDDING_MAX_SEQ_LENGTH,
+                 threads: Optional[int] = EMBEDDING_THREADS, n_workers: int = EMBEDDING_POOL_WORKERS):
+        EmbeddingBackend.__init__(self, batch_size)
+        self.model_name = model_name
+        self.max_seq_length = max_seq_length
+        self.n_workers = n_workers
+        threads = threads or max(1, (os.cpu_count() or 1) // n_workers)
+        self.pool = ProcessPoolExecutor(max_workers=n_workers, initializer=_init_embedding_worker,
+                                        initargs=(model_name, max_seq_length, threads, batch_size))
+    
+    @property
+    def parallelism(self) -> int:
+        return self.n_workers
+    
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        return self.pool.submit(_embed_shard, texts).result()
+    
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        shards = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        return np.vstack(list(self.pool.map(_embed_shard, shards)))
+    
+    def close(self):
+        self.pool.shutdown()
+
+class HashingBackend(EmbeddingBackend):
+    """
+    Deterministic bag-of-words embeddings from hashed word unigrams and bigrams. Needs
+    no model download and is identical across processes and runs; meant for tests and
+    benchmarks of the rest of the pipeline, not for real duplicate detection.
+    """
+    def __init__(self, dim: int = 384, batch_size: int = EMBEDDING_BATCH_SIZE):
+        super().__init__(batch_size)
+        self.dim = dim
+    
+    @property
+    def cache_key(self) -> str:
+        return f"hashing-{self.dim}"
+    
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = normalize_text(text).split()
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                h = zlib.crc32(feature.encode('utf-8'))
+                vectors[row, h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+def load_embedding_model(model_name: str = EMBEDDING_MODEL, backend: str = EMBEDDING_BACKEND,
+                         batch_size: int = EMBEDDING_BATCH_SIZE) -> EmbeddingBackend:
+    """Create the configured embedding backend."""
+    print(f"Initializing {backend} embedding backend: {model_name}")
+    if backend == 'huggingface':
+        return HuggingFaceBackend(model_name, batch_size)
+    if backend == 'cpu_pool':
+        return CPUPoolBackend(model_name, batch_size)
+    if backend == 'hashing':
+        return HashingBackend(batch_size=batch_size)
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+def quantize_embeddings(matrix: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Convert float embeddings to the storage dtype. Returns (stored values, row scales);
+    row scales are only used by int8, where each row is scaled so its largest component
+    maps to 127. Cosine similarity does not depend on the row scale.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if dtype in ('float32', 'float16', 'pq'):
+        return matrix.astype(np.float16 if dtype != 'float32' else np.float32), None
+    if dtype == 'int8':
+        scales = np.abs(matrix).max(axis=1) / 127
+        scales[scales == 0] = 1
+        return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    raise ValueError(f"Unknown embedding storage dtype: {dtype}")
+
+def dequantize_embeddings(stored: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """Inverse of quantize_embeddings, returning float32."""
+    values = np.asarray(stored, dtype=np.float32)
+    return values * scales[:, None] if scales is not None else values
+
+def _pq_subquantizers(dim: int, wanted: int = PQ_SUBQUANTIZERS) -> int:
+    """Largest number of sub-vectors not above wanted that divides dim."""
+    return max(m for m in range(1, min(wanted, dim) + 1) if dim % m == 0)
+
+def _pq_bits(n_train: int) -> int:
+    """Bits per PQ code, fewer than 8 when there are too few points to train 256 centroids."""
+    return int(min(8, max(1, np.log2(max(n_train // 39, 2)))))
+
+def _normalized(matrix: np.ndarray) -> np.ndarray:
+    import faiss
+    vectors = np.array(matrix, dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def _index_recall_at_k(index, matrix: np.ndarray, sample: np.ndarray, k: int,
+                       block_size: int = 8192) -> float:
+    """
+    Recall@k of searching index with the sampled rows of matrix, against their exact
+    cosine neighbours over all rows, found by scanning matrix block by block.
+    """
+    queries = _normalized(matrix[sample])
+    k = min(k, len(matrix))
+    best_scores = np.empty((len(sample), 0), dtype=np.float32)
+    best_rows = np.empty((len(sample), 0), dtype=np.int64)
+    for start in range(0, len(matrix), block_size):
+        scores = queries @ _normalized(matrix[start:start + block_size]).T
+        rows = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+        scores, rows = np.hstack([best_scores, scores]), np.hstack([best_rows, rows])
+        top = np.argpartition(-scores, min(k, scores.shape[1]) - 1, axis=1)[:, :k]
+        best_scores, best_rows = np.take_along_axis(scores, top, 1), np.take_along_axis(rows, top, 1)
+    _, found = index.search(queries, k)
+    hits = sum(len(set(exact) & set(approx)) for exact, approx in zip(best_rows.tolist(), found.tolist()))
+    return hits / (len(sample) * k)
+
+def quantization_recall(matrix: np.ndarray, dtype: str, doc_ids: List[str],
+                        labeled_pairs: Optional[List[Tuple[str, str, bool]]] = None,
+                        similarity_threshold: float = SIMILARITY_THRESHOLD,
+                        sample_size: int = QUANTIZATION_EVAL_SAMPLE,
+                        index=None, k: int = QUERY_TOP_K,
+                        quantized: Optional[np.ndarray] = None) -> Dict[str, float]:
+    """
+    Measure how quantization changes duplicate detection against full precision.
+    The quantized vectors are the stored document matrix that the grouping stages
+    read; for "pq" that is float16, since the PQ codes only live in the document index.
+    With labeled_pairs (doc_a, doc_b, is_duplicate), recall is measured on the labeled
+    duplicates for both full-precision and quantized vectors. Otherwise the pairs that
+    full precision finds among a seeded random sample of documents are the reference,
+    and recall/precision of the quantized vectors are reported against them.
+    With index (the document index queries are served from), recall@k of its searches
+    for the sampled documents against exact full-precision neighbours is reported too.
+    quantized is the stored document matrix when it was not made by quantizing matrix
+    directly (means of cache-quantized chunk vectors); int8 rows may stay unscaled, as
+    only cosine similarities are compared. Without it, matrix is quantized here.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    n_docs, dim = matrix.shape
+    matrix_dtype = 'float16' if dtype == 'pq' else dtype
+    if quantized is None:
+        decode = lambda rows: dequantize_embeddings(*quantize_embeddings(matrix[rows], matrix_dtype))
+    else:
+        decode = lambda rows: np.asarray(quantized[rows], dtype=np.float32)
+    bytes_per_vector = dim * {'float32': 4, 'float16': 2, 'int8': 1}[matrix_dtype] + (4 if dtype == 'int8' else 0)
+    
+    report = {'dtype': dtype, 'matrix_dtype': matrix_dtype, 'bytes_per_vector': bytes_per_vector,
+              'compression': round(4 * dim / bytes_per_vector, 2)}
+    sample = np.sort(np.random.default_rng(42).choice(n_docs, min(n_docs, sample_size), replace=False))
+    if index is not None:
+        report.update({'index': type(index).__name__, 'k': min(k, n_docs),
+                       'index_recall_at_k': _index_recall_at_k(index, matrix, sample, k)})
+    
+    if labeled_pairs:
+        position = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        duplicates = [(position[a], position[b]) for a, b, is_dup in labeled_pairs
+                      if is_dup and a in position and b in position]
+        if not duplicates:
+            raise ValueError("No labeled duplicate pairs refer to known documents")
+        left, right = (np.array(side) for side in zip(*duplicates))
+        full_scores = np.sum(_normalized(matrix[left]) * _normalized(matrix[right]), axis=1)
+        quant_scores = np.sum(_normalized(decode(left)) * _normalized(decode(right)), axis=1)
+        report.update({
+            'labeled_duplicates': len(duplicates),
+            'full_precision_recall': float(np.mean(full_scores >= similarity_threshold)),
+            'recall': float(np.mean(quant_scores >= similarity_threshold)),
+            'max_score_error': float(np.abs(full_scores - quant_scores).max()),
+        })
+        return report
+    
+    full = _normalized(matrix[sample])
+    quant = _normalized(decode(sample))
+    full_scores = full @ full.T
+    quant_scores = quant @ quant.T
+    upper = np.triu(np.ones_like(full_scores, dtype=bool), k=1)
+    reference = (full_scores >= similarity_threshold) & upper
+    found = (quant_scores >= similarity_threshold) & upper
+    report.update({
+        'sampled_documents': len(sample),
+        'reference_pairs': int(reference.sum()),
+        'recall': float((reference & found).sum() / reference.sum()) if reference.any() else 1.0,
+        'precision': float((reference & found).sum() / found.sum()) if found.any() else 1.0,
+        'max_score_error': float(np.abs(full_scores - quant_scores)[upper].max()) if upper.any() else 0.0,
+    })
+    return report
+
+def quantized_faiss_index(matrix: np.ndarray, dtype: str, metric: int, hnsw: bool = False):
+    """
+    Empty FAISS index holding vectors in the storage dtype, trained on up to 100k
+    normalized rows of matrix when the index type needs training: flat float32, SQfp16
+    for float16, SQ8 for int8 and PQ (PQ_SUBQUANTIZERS bytes per vector) for pq. With
+    hnsw, an HNSW graph is built over the flat or scalar-quantized vectors.
+    """
+    import faiss
+    n_rows, dim = matrix.shape
+    if dtype == 'pq':
+        index = faiss.IndexPQ(dim, _pq_subquantizers(dim), _pq_bits(min(n_rows, 100_000)), metric)
+    elif dtype in ('float16', 'int8'):
+        qtype = faiss.ScalarQuantizer.QT_fp16 if dtype == 'float16' else faiss.ScalarQuantizer.QT_8bit
+        index = (faiss.IndexHNSWSQ(dim, qtype, ANN_HNSW_M, metric) if hnsw
+                 else faiss.IndexScalarQuantizer(dim, qtype, metric))
+    elif dtype == 'float32':
+        index = (faiss.IndexHNSWFlat(dim, ANN_HNSW_M, metric) if hnsw
+                 else faiss.IndexFlat(dim, metric))
+    else:
+        raise ValueError(f"Unknown embedding storage dtype: {dtype}")
+    if not index.is_trained:
+        train_rows = np.sort(np.random.default_rng(0).choice(n_rows, min(n_rows, 100_000), replace=False))
+        index.train(_normalized(matrix[train_rows]))
+    return index
+
+def build_document_index(matrix: np.ndarray, dtype: str = EMBEDDING_STORAGE_DTYPE, batch_size: int = 65536):
+    """
+    Build a FAISS inner-product index over L2-normalized document vectors in the
+    storage dtype (see quantized_faiss_index), adding rows in batches so a
+    memory-mapped matrix is never copied whole. Exact up to DOC_INDEX_HNSW_MIN
+    documents and HNSW above, except for pq, which is always a flat PQ index.
+    """
+    import faiss
+    n_docs, dim = matrix.shape
+    index = quantized_faiss_index(matrix, dtype, faiss.METRIC_INNER_PRODUCT,
+                                  hnsw=dtype != 'pq' and n_docs >= DOC_INDEX_HNSW_MIN)
+    for start in range(0, n_docs, batch_size):
+        batch = np.array(matrix[start:start + batch_size], dtype=np.float32)
+        faiss.normalize_L2(batch)
+        index.add(batch)
+    return index
+
+def build_chunk_vectorstore(texts: List[str], vectors: np.ndarray, metadatas: List[Dict],
+                            embedding: EmbeddingBackend, dtype: str = EMBEDDING_STORAGE_DTYPE) -> FAISS:
+    """
+    LangChain FAISS vector store over L2-normalized chunk vectors, with the index
+    holding them in the storage dtype (see quantized_faiss_index).
+    """
+    import faiss
+    from langchain.vectorstores import FAISS
+    from langchain.docstore.in_memory import InMemoryDocstore
+    index = quantized_faiss_index(vectors, dtype, faiss.METRIC_L2)
+    vectorstore = FAISS(embedding, index, InMemoryDocstore({}), {}, normalize_L2=True)
+    vectorstore.add_embeddings(list(zip(texts, vectors.tolist())), metadatas=metadatas)
+    return vectorstore
+
+def segment_mean(matrix: np.ndarray, ranges: np.ndarray) -> np.ndarray:
+    """
+    Mean of matrix rows over each [start, end) range, as float32.
+    Ranges that tile the matrix back to back (the layout chunk_documents produces) are
+    reduced with a single np.add.reduceat; anything else falls back to one slice per range.
+    """
+    if len(ranges) == 0:
+        return np.empty((0, matrix.shape[1]), dtype=np.float32)
+    starts, ends = ranges[:, 0], ranges[:, 1]
+    counts = (ends - starts)[:, None]
+    if starts[0] == 0 and ends[-1] == len(matrix) and np.array_equal(starts[1:], ends[:-1]):
+        sums = np.add.reduceat(matrix, starts, axis=0, dtype=np.float64)
+    else:
+        sums = np.vstack([matrix[start:end].sum(axis=0, dtype=np.float64) for start, end in ranges])
+    return (sums / counts).astype(np.float32)
+
+def symmetric_csr_from_edges(edge_parts: Callable[[], Iterable[Tuple[np.ndarray, np.ndarray, np.ndarray]]],
+                             n: int) -> sparse.csr_matrix:
+    """
+    Assemble the symmetric n x n CSR matrix of upper-triangle edges given as (rows,
+    cols, scores) parts, without concatenating them: one pass counts the entries of
+    every row, a second scatters each part straight into the preallocated CSR arrays.
+    Peak memory is the finished matrix plus one part. edge_parts() must return a new
+    iterator over the parts each time it is called.
+    """
+    from scipy import sparse
+    degree = np.zeros(n, dtype=np.int64)
+    for rows, cols, _ in edge_parts():
+        degree += np.bincount(rows, minlength=n)
+        degree += np.bincount(cols, minlength=n)
+    nnz = int(degree.sum())
+    index_dtype = np.int32 if max(n, nnz) < np.iinfo(np.int32).max else np.int64
+    indptr = np.zeros(n + 1, dtype=index_dtype)
+    np.cumsum(degree, out=indptr[1:])
+    indices = np.empty(nnz, dtype=index_dtype)
+    data = np.empty(nnz, dtype=np.float32)
+    
+    # Next free slot of every row
+    fill = indptr[:-1].astype(np.int64)
+    for rows, cols, scores in edge_parts():
+        # Every edge is entered in its row and, mirrored, in its column
+        for source, target in ((rows, cols), (cols, rows)):
+            order = np.argsort(source, kind='stable')
+            ordered = source[order]
+            rank = np.arange(len(ordered)) - np.searchsorted(ordered, ordered)
+            positions = fill[ordered] + rank
+            indices[positions] = target[order]
+            data[positions] = scores[order]
+            fill += np.bincount(source, minlength=n)
+    
+    graph = sparse.csr_matrix((data, indices, indptr), shape=(n, n))
+    graph.sort_indices()
+    return graph
+
+def normalize_text(text: str) -> str:
+    """Collapse all whitespace runs so formatting-only differences hash identically."""
+    return " ".join(text.split())
+
+def minhash_signature(text: str, permutations: Tuple[np.ndarray, np.ndarray],
+                      shingle_size: int = SHINGLE_SIZE) -> np.ndarray:
+    """Compute the MinHash signature of a text's word shingles."""
+    # Universal hashing modulo a Mersenne prime; a, b < 2^29 and crc32 < 2^32 keep a*x + b below 2^64
+    prime = np.uint64((1 << 61) - 1)
+    a, b = permutations
+    words = text.split()
+    if len(words) <= shingle_size:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+    hashes = np.fromiter((zlib.crc32(sh.encode('utf-8')) for sh in shingles),
+                         dtype=np.uint64, count=len(shingles))
+    
+    signature = np.full(len(a), np.iinfo(np.uint64).max, dtype=np.uint64)
+    # Hash shingles in slices so very long documents don't allocate a huge matrix
+    for start in range(0, len(hashes), 8192):
+        block = hashes[start:start + 8192, None]
+        np.minimum(signature, ((block * a + b) % prime).min(axis=0), out=signature)
+    return signature
+
+def parquet_available() -> bool:
+    """Whether the optional pyarrow dependency for Parquet export is installed."""
+    return importlib.util.find_spec('pyarrow') is not None
+
+class ResultTableWriter:
+    """Streams column batches to a Parquet or CSV file without holding the whole table."""
+    def __init__(self, path: str, fmt: str = 'parquet'):
+        if fmt == 'parquet' and not parquet_available():
+            raise ImportError("pyarrow is required for Parquet export; use fmt='csv' instead")
+        if fmt not in ('parquet', 'csv'):
+            raise ValueError(f"Unknown export format: {fmt}")
+        self.path = path
+        self.fmt = fmt
+        self.rows = 0
+        self._writer = None
+        
+    def write(self, columns: Dict[str, object]):
+        """Append one batch given as {column name: sequence}."""
+        import pandas as pd
+        batch = pd.DataFrame(columns)
+        if batch.empty and self.rows:
+            return
+        if self.fmt == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self._writer is None:
+                table = pa.Table.from_pandas(batch, preserve_index=False)
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            else:
+                # Later batches are coerced to the schema of the first one
+                table = pa.Table.from_pandas(batch, schema=self._writer.schema, preserve_index=False)
+            self._writer.write_table(table)
+        else:
+            batch.to_csv(self.path, mode='w' if self._writer is None else 'a',
+                         header=self._writer is None, index=False)
+            self._writer = True
+        self.rows += len(batch)
+        
+    def close(self):
+        if self.fmt == 'parquet' and self._writer is not None:
+            self._writer.close()
+        
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+class EmbeddingCache:
+    """
+    Persistent cache of chunk embeddings keyed by chunk content hash, stored in the
+    given storage dtype (int8 blobs start with their float32 row scale; pq stores
+    float16). Entries are namespaced by embedding model, chunking parameters and
+    stored dtype, so changing any of them never serves stale vectors. Each embedding store keeps its own cache file
+    (see DuplicateDetector.open_embedding_cache), since eviction drops every entry
+    the current corpus does not use.
+    """
+    # SQLite limits the number of bound parameters per statement
+    _QUERY_BATCH = 900
+    
+    def __init__(self, path: str, model_name: str = EMBEDDING_MODEL,
+                 chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                 dtype: str = EMBEDDING_STORAGE_DTYPE):
+        self.path = path
+        self.dtype = 'float16' if dtype == 'pq' else dtype
+        self.namespace = f"{model_name}|{chunk_size}|{chunk_overlap}|{self.dtype}"
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_embeddings ("
+            "namespace TEXT NOT NULL, content_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (namespace, content_hash))"
+        )
+        self.conn.commit()
+        
+    @staticmethod
+    def content_hash(text: str) -> str:
+        """Hash chunk text to its cache key."""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+    
+    def _decode(self, blob: bytes) -> np.ndarray:
+        if self.dtype == 'int8':
+            scale = np.frombuffer(blob[:4], dtype=np.float32)
+            return dequantize_embeddings(np.frombuffer(blob[4:], dtype=np.int8)[None], scale)[0]
+        return dequantize_embeddings(np.frombuffer(blob, dtype=self.dtype))
+    
+    def get_many(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """Return cached float32 vectors for whichever of the given hashes are present."""
+        found = {}
+        for start in range(0, len(hashes), self._QUERY_BATCH):
+            batch = hashes[start:start + self._QUERY_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT content_hash, vector FROM chunk_embeddings "
+                f"WHERE namespace = ? AND content_hash IN ({placeholders})",
+                [self.namespace, *batch]
+            )
+            for content_hash, blob in rows:
+                found[content_hash] = self._decode(blob)
+        return found
+    
+    def put_many(self, items: List[Tuple[str, np.ndarray]]) -> List[Tuple[str, np.ndarray]]:
+        """
+        Store (hash, vector) pairs. Returns them with the vectors as later get_many calls
+        will return them, so fresh and cached runs see identical values.
+        """
+        if not items:
+            return []
+        values, scales = quantize_embeddings(np.vstack([v for _, v in items]), self.dtype)
+        if scales is not None:
+            blobs = [scale.tobytes() + row.tobytes() for scale, row in zip(scales, values)]
+        else:
+            blobs = [row.tobytes() for row in values]
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO chunk_embeddings (namespace, content_hash, vector) VALUES (?, ?, ?)",
+            [(self.namespace, h, blob) for (h, _), blob in zip(items, blobs)]
+        )
+        self.conn.commit()
+        return [(h, self._decode(blob)) for (h, _), blob in zip(items, blobs)]
+        
+    def evict_except(self, live_hashes: Set[str]) -> int:
+        """Delete entries in this namespace that no current chunk refers to."""
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS live_hashes (content_hash TEXT PRIMARY KEY)")
+        self.conn.execute("DELETE FROM live_hashes")
+        self.conn.executemany("INSERT OR IGNORE INTO live_hashes VALUES (?)", [(h,) for h in live_hashes])
+        cursor = self.conn.execute(
+            "DELETE FROM chunk_embeddings WHERE namespace = ? "
+            "AND content_hash NOT IN (SELECT content_hash FROM live_hashes)",
+            (self.namespace,)
+        )
+        self.conn.execute("DROP TABLE live_hashes")
+        self.conn.commit()
+        return cursor.rowcount
+    
+    def close(self):
+        self.conn.close()
+
+class EmbeddingStore:
+    """
+    Contiguous document embedding matrix on disk plus a separate doc-id index.
+    The matrix is memory-mapped read-only on load, so startup does not deserialize it
+    and concurrent analysis processes share the OS page cache. It is stored as float32,
+    float16 or per-row scaled int8 (see quantize_embeddings); the dtype and int8 row
+    scales are kept next to it, and the metadata file also records the dimension and
+    the embedding backend and model that produced the vectors. Chunk vectors use the
+    same dtype; int8 chunk rows are stored without their scales, because chunk vectors
+    only feed cosine comparisons, which do not depend on the row scale.
+    """
+    MATRIX_FILE = "embeddings.npy"
+    INDEX_FILE = "doc_ids.json"
+    META_FILE = "store_meta.json"
+    SCALES_FILE = "row_scales.npy"
+    CHUNK_MATRIX_FILE = "chunk_embeddings.npy"
+    CHUNK_INDEX_FILE = "chunk_index.jsonl"
+    CACHE_FILE = "embedding_cache.sqlite"
+    DOC_FAISS_FILE = "doc_index.faiss"
+    CHUNK_FAISS_DIR = "chunk_faiss"
+    UMAP_DIR = "umap"
+    # Intermediate results, so each CLI stage can run in its own process
+    INGEST_FILE = "ingest.json"
+    CHUNK_TEXT_FILE = "chunks.jsonl"
+    GROUPS_FILE = "duplicate_groups.json"
+    CLUSTERS_FILE = "clusters.json"
+    LINKAGE_FILE = "linkage.npy"
+    GRAPH_FILE = "similarity_graph.npz"
+    PASSAGES_FILE = "shared_passages.jsonl"
+    
+    def __init__(self, store_dir: str = EMBEDDING_STORE_DIR):
+        self.store_dir = store_dir
+        self.matrix_path = os.path.join(store_dir, self.MATRIX_FILE)
+        self.index_path = os.path.join(store_dir, self.INDEX_FILE)
+        self.doc_faiss_path = os.path.join(store_dir, self.DOC_FAISS_FILE)
+        self.chunk_faiss_dir = os.path.join(store_dir, self.CHUNK_FAISS_DIR)
+        self.umap_dir = os.path.join(store_dir, self.UMAP_DIR)
+        
+    def exists(self) -> bool:
+        return os.path.exists(self.matrix_path) and os.path.exists(self.index_path)
+    
+    def artifact_path(self, name: str) -> str:
+        return os.path.join(self.store_dir, name)
+    
+    def save_json(self, name: str, obj):
+        """Atomically write one JSON artifact."""
+        os.makedirs(self.store_dir, exist_ok=True)
+        path = self.artifact_path(name)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(obj, f)
+        os.replace(path + ".tmp", path)
+    
+    def load_json(self, name: str):
+        """Return one JSON artifact, or None if that stage has not run."""
+        path = self.artifact_path(name)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    
+    def save_jsonl(self, name: str, records: Iterable):
+        """Atomically write an artifact with one JSON record per line."""
+        os.makedirs(self.store_dir, exist_ok=True)
+        path = self.artifact_path(name)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        os.replace(path + ".tmp", path)
+    
+    def load_jsonl(self, name: str) -> Optional[List]:
+        path = self.artifact_path(name)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+    
+    def clear_analysis(self):
+        """
+        Remove the stage results (duplicate groups, shared passages, similarity graph,
+        clusters, linkage matrix) computed from the documents or embeddings being replaced.
+        """
+        for name in (self.GROUPS_FILE, self.PASSAGES_FILE, self.GRAPH_FILE, self.CLUSTERS_FILE, self.LINKAGE_FILE):
+            if os.path.exists(self.artifact_path(name)):
+                os.remove(self.artifact_path(name))
+    
+    def _save_meta(self, dtype: str, dim: int, meta: Optional[Dict] = None):
+        with open(os.path.join(self.store_dir, self.META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({**(meta or {}), 'dtype': dtype, 'dim': dim}, f)
+    
+    @staticmethod
+    def _write_quantized(path: str, matrix: np.ndarray, dtype: str, batch_size: int = 65536) -> Optional[np.ndarray]:
+        """Write matrix to an .npy file in the storage dtype, batch by batch; returns int8 row scales."""
+        stored_dtype = {'float32': np.float32, 'float16': np.float16, 'pq': np.float16, 'int8': np.int8}[dtype]
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=stored_dtype, shape=matrix.shape)
+        scales = np.ones(len(matrix), dtype=np.float32) if dtype == 'int8' else None
+        for start in range(0, len(matrix), batch_size):
+            values, batch_scales = quantize_embeddings(matrix[start:start + batch_size], dtype)
+            out[start:start + batch_size] = values
+            if scales is not None:
+                scales[start:start + batch_size] = batch_scales
+        out.flush()
+        del out
+        return scales
+    
+    def save(self, doc_ids: List[str], matrix: np.ndarray, dtype: str = EMBEDDING_STORAGE_DTYPE,
+             batch_size: int = 65536, meta: Optional[Dict] = None):
+        """
+        Write the matrix (converted to the storage dtype batch by batch) and the doc-id
+        index, replacing any previous store atomically. meta (e.g. the embedding model)
+        is recorded in the store metadata. Analysis results of the previous store are removed.
+        """
+        if len(doc_ids) != len(matrix):
+            raise ValueError(f"Got {len(doc_ids)} doc ids for {len(matrix)} embedding rows")
+        os.makedirs(self.store_dir, exist_ok=True)
+        self.clear_analysis()
+        
+        # Write to temporary files first so readers never see a half-written store
+        tmp_matrix = self.matrix_path + ".tmp"
+        scales = self._write_quantized(tmp_matrix, matrix, dtype, batch_size)
+        if scales is not None:
+            np.save(os.path.join(self.store_dir, self.SCALES_FILE), scales)
+        self._save_meta(dtype, matrix.shape[1], meta)
+        tmp_index = self.index_path + ".tmp"
+        with open(tmp_index, 'w', encoding='utf-8') as f:
+            json.dump(doc_ids, f)
+        os.replace(tmp_matrix, self.matrix_path)
+        os.replace(tmp_index, self.index_path)
+        
+    def load(self) -> Tuple[List[str], np.ndarray]:
+        """Return the doc-id index and a read-only memory map of the embedding matrix."""
+        if not self.exists():
+            raise FileNotFoundError(f"No embedding store found in {self.store_dir}")
+        with open(self.index_path, encoding='utf-8') as f:
+            doc_ids = json.load(f)
+        matrix = np.load(self.matrix_path, mmap_mode='r')
+        return doc_ids, matrix
+    
+    def store_meta(self) -> Dict:
+        """Metadata recorded at save time (empty for stores written before it was recorded)."""
+        meta_path = os.path.join(self.store_dir, self.META_FILE)
+        if not os.path.exists(meta_path):
+            return {}
+        with open(meta_path, encoding='utf-8') as f:
+            return json.load(f)
+    
+    def storage_dtype(self) -> str:
+        """Storage dtype recorded at save time ("float32" for stores written before it was recorded)."""
+        return self.store_meta().get('dtype', 'float32')
+    
+    def load_row_scales(self) -> Optional[np.ndarray]:
+        """Per-row scales of an int8 store, or None."""
+        if self.storage_dtype() != 'int8':
+            return None
+        return np.load(os.path.join(self.store_dir, self.SCALES_FILE))
+    
+    def save_doc_index(self, index):
+        """Persist the document-level FAISS index."""
+        import faiss
+        os.makedirs(self.store_dir, exist_ok=True)
+        faiss.write_index(index, self.doc_faiss_path + ".tmp")
+        os.replace(self.doc_faiss_path + ".tmp", self.doc_faiss_path)
+        
+    def load_doc_index(self):
+        """Load the document-level FAISS index, memory-mapped where the index type allows it."""
+        import faiss
+        try:
+            return faiss.read_index(self.doc_faiss_path, faiss.IO_FLAG_MMAP)
+        except RuntimeError:
+            return faiss.read_index(self.doc_faiss_path)
+    
+    def save_projection(self, reducer, keys: List[str], coords: np.ndarray):
+        """Persist a fitted UMAP reducer with the 2-D coordinates of the rows it has seen."""
+        os.makedirs(self.umap_dir, exist_ok=True)
+        if reducer is not None:
+            with open(os.path.join(self.umap_dir, "reducer.pkl.tmp"), 'wb') as f:
+                pickle.dump(reducer, f)
+            os.replace(os.path.join(self.umap_dir, "reducer.pkl.tmp"), os.path.join(self.umap_dir, "reducer.pkl"))
+        with open(os.path.join(self.umap_dir, "coords.npy"), 'wb') as f:
+            np.save(f, np.asarray(coords, dtype=np.float32))
+        with open(os.path.join(self.umap_dir, "keys.json"), 'w', encoding='utf-8') as f:
+            json.dump(keys, f)
+    
+    def load_projection(self) -> Tuple[Optional[object], List[str], np.ndarray]:
+        """Return (reducer, row keys, coordinates) of the saved projection, or (None, [], empty)."""
+        keys_path = os.path.join(self.umap_dir, "keys.json")
+        reducer_path = os.path.join(self.umap_dir, "reducer.pkl")
+        if not os.path.exists(keys_path) or not os.path.exists(reducer_path):
+            return None, [], np.empty((0, 2), dtype=np.float32)
+        with open(reducer_path, 'rb') as f:
+            reducer = pickle.load(f)
+        with open(keys_path, encoding='utf-8') as f:
+            keys = json.load(f)
+        coords = np.load(os.path.join(self.umap_dir, "coords.npy"))
+        return reducer, keys, coords
+    
+    @staticmethod
+    def _raw_to_npy(raw_path: str, npy_path: str, dim: int):
+        """Wrap a raw float32 row file in an .npy header without loading it into memory."""
+        rows = os.path.getsize(raw_path) // (4 * dim) if dim else 0
+        with open(npy_path, 'wb') as out, open(raw_path, 'rb') as raw:
+            np.lib.format.write_array_header_1_0(
+                out, {'descr': '<f4', 'fortran_order': False, 'shape': (rows, dim)})
+            shutil.copyfileobj(raw, out, 16 * 1024 * 1024)
+    
+    def save_streamed(self, doc_ids: List[str], raw_path: str, dim: int,
+                      dtype: str = EMBEDDING_STORAGE_DTYPE, meta: Optional[Dict] = None):
+        """
+        Install document vectors that were appended to a raw float32 file as the store.
+        Analysis results of the previous store are removed.
+        """
+        os.makedirs(self.store_dir, exist_ok=True)
+        self.clear_analysis()
+        if dtype != 'float32':
+            # Quantize from a memory map of the raw rows, batch by batch
+            rows = os.path.getsize(raw_path) // (4 * dim) if dim else 0
+            self.save(doc_ids, np.memmap(raw_path, dtype=np.float32, mode='r', shape=(rows, dim)), dtype,
+                      meta=meta)
+            return
+        tmp_matrix = self.matrix_path + ".tmp"
+        self._raw_to_npy(raw_path, tmp_matrix, dim)
+        self._save_meta(dtype, dim, meta)
+        tmp_index = self.index_path + ".tmp"
+        with open(tmp_index, 'w', encoding='utf-8') as f:
+            json.dump(doc_ids, f)
+        os.replace(tmp_matrix, self.matrix_path)
+        os.replace(tmp_index, self.index_path)
+    
+    def save_chunks_streamed(self, raw_path: str, index_path: str, dim: int,
+                             dtype: str = EMBEDDING_STORAGE_DTYPE):
+        """Install chunk vectors (raw float32 file) in the storage dtype and their (source, offset) JSON-lines index."""
+        os.makedirs(self.store_dir, exist_ok=True)
+        tmp_matrix = os.path.join(self.store_dir, self.CHUNK_MATRIX_FILE + ".tmp")
+        if dtype == 'float32':
+            self._raw_to_npy(raw_path, tmp_matrix, dim)
+        else:
+            rows = os.path.getsize(raw_path) // (4 * dim) if dim else 0
+            self._write_quantized(tmp_matrix, np.memmap(raw_path, dtype=np.float32, mode='r', shape=(rows, dim)), dtype)
+        os.replace(tmp_matrix, os.path.join(self.store_dir, self.CHUNK_MATRIX_FILE))
+        os.replace(index_path, os.path.join(self.store_dir, self.CHUNK_INDEX_FILE))
+    
+    def save_chunks(self, chunk_refs: List[Tuple[str, int]], matrix: np.ndarray,
+                    dtype: str = EMBEDDING_STORAGE_DTYPE):
+        """Install in-memory chunk vectors in the storage dtype and their (source, offset) index."""
+        os.makedirs(self.store_dir, exist_ok=True)
+        tmp_matrix = os.path.join(self.store_dir, self.CHUNK_MATRIX_FILE + ".tmp")
+        self._write_quantized(tmp_matrix, matrix, dtype)
+        self.save_jsonl(self.CHUNK_INDEX_FILE, chunk_refs)
+        os.replace(tmp_matrix, os.path.join(self.store_dir, self.CHUNK_MATRIX_FILE))
+    
+    def clear_chunks(self, vectors: bool = True, vectorstore: bool = True):
+        """Remove saved chunk vectors with their (source, offset) index and/or the chunk FAISS store."""
+        if vectors:
+            for name in (self.CHUNK_MATRIX_FILE, self.CHUNK_INDEX_FILE):
+                if os.path.exists(self.artifact_path(name)):
+                    os.remove(self.artifact_path(name))
+        if vectorstore and os.path.isdir(self.chunk_faiss_dir):
+            shutil.rmtree(self.chunk_faiss_dir)
+    
+    def load_chunks(self) -> Tuple[List[Tuple[str, int]], np.ndarray]:
+        """Return the chunk (source, offset) index and a memory map of the chunk vectors."""
+        with open(os.path.join(self.store_dir, self.CHUNK_INDEX_FILE), encoding='utf-8') as f:
+            chunk_index = [tuple(json.loads(line)) for line in f]
+        matrix = np.load(os.path.join(self.store_dir, self.CHUNK_MATRIX_FILE), mmap_mode='r')
+        return chunk_index, matrix
 
 class DuplicateDetector:
-    def __init__(self, document_dir: str, embedding_model: str = EMBEDDING_MODEL):
+    def __init__(self, document_dir: str, embedding_model: str = EMBEDDING_MODEL,
+                 store_dir: str = EMBEDDING_STORE_DIR, n_workers: int = N_WORKERS,
+                 embedding_backend: str = EMBEDDING_BACKEND):
         """Initialize the duplicate detector."""
         self.document_dir = document_dir
+        self.n_workers = n_workers
+        self.store = EmbeddingStore(store_dir)
         self.embedding_model_name = embedding_model
+        self.embedding_backend = embedding_backend
         self.embedding_model = None
         self.documents = []
+        self.exact_duplicates = {}
+        self.near_duplicate_pairs = []
+        self.shared_passages = []
         self.chunks = []
-        self.document_embeddings = {}
+        self.chunk_ranges = {}
+        self.chunk_embeddings = None
+        self.doc_ids = []
+        self.embedding_matrix = None
+        self.embedding_scales = None
         self.similarity_matrix = None
+        self.similarity_graph = None
         self.document_clusters = None
+        self.duplicate_groups = None
+        self.duplicate_groups_threshold = None
+        self.linkage_matrix = None
+        self.cluster_stats = {}
         self.faiss_index = None
         
+    @property
+    def document_embeddings(self) -> Dict[str, np.ndarray]:
+        """Per-document embeddings as zero-copy row views of the embedding matrix."""
+        if self.embedding_matrix is None:
+            return {}
+        if self.embedding_scales is not None:
+            return dict(zip(self.doc_ids, self.embedding_rows()))
+        return dict(zip(self.doc_ids, self.embedding_matrix))
+    
+    def load_embeddings(self) -> np.ndarray:
+        """Memory-map the document embedding matrix from the embedding store."""
+        self.doc_ids, self.embedding_matrix = self.store.load()
+        self.embedding_scales = self.store.load_row_scales()
+        print(f"Mapped {len(self.doc_ids)} document embeddings from {self.store.store_dir} "
+              f"({self.embedding_matrix.dtype})")
+        return self.embedding_matrix
+    
+    def embedding_rows(self, rows=slice(None)) -> np.ndarray:
+        """
+        Float32 copy of the selected embedding rows, undoing int8 row scaling. Cosine-based
+        stages read the stored matrix directly; this is for Euclidean consumers (ward
+        linkage, UMAP) that need the original magnitudes.
+        """
+        scales = None if self.embedding_scales is None else self.embedding_scales[rows]
+        return dequantize_embeddings(self.embedding_matrix[rows], scales)
+    
+    def evaluate_quantization(self, dtype: str = EMBEDDING_STORAGE_DTYPE, labeled_pairs=None,
+                              similarity_threshold: float = SIMILARITY_THRESHOLD,
+                              sample_size: int = QUANTIZATION_EVAL_SAMPLE,
+                              full_precision: Optional[np.ndarray] = None, index=None,
+                              rounded_chunks: int = 0, quantized: Optional[np.ndarray] = None) -> Dict[str, float]:
+        """
+        Check duplicate recall of a storage dtype against full-precision document vectors.
+        labeled_pairs is a list of (doc_a, doc_b, is_duplicate) tuples or a CSV path with
+        doc_a, doc_b, is_duplicate columns; without it a document sample is compared
+        against full-precision pairs. Full-precision vectors are rebuilt from the chunk
+        embeddings when they are in memory (as the cache serves them), or read from a
+        float32 store. Query recall@QUERY_TOP_K is checked on index, the document index
+        built in this dtype (one is built from the full-precision vectors if not given).
+        quantized is the stored matrix to compare (see quantization_recall); rounded_chunks
+        counts chunk vectors behind full_precision that had already been quantized by the
+        EmbeddingCache, whose chunk-level error is therefore not measured.
+        """
+        import pandas as pd
+        if full_precision is None:
+            if self.chunk_embeddings is not None and len(self.chunk_embeddings):
+                ranges = np.asarray([self.chunk_ranges[doc_id] for doc_id in self.doc_ids], dtype=np.int64)
+                full_precision = segment_mean(self.chunk_embeddings, ranges.reshape(-1, 2))
+                if EMBEDDING_STORAGE_DTYPE != 'float32':
+                    rounded_chunks = len(self.chunk_embeddings)
+            elif self.embedding_matrix is not None and self.embedding_matrix.dtype == np.float32:
+                full_precision = self.embedding_matrix
+            else:
+                raise ValueError("Full-precision embeddings are not available; re-embed to evaluate quantization")
+        
+        if isinstance(labeled_pairs, (str, Path)):
+            labels = pd.read_csv(labeled_pairs)
+            labeled_pairs = list(zip(labels['doc_a'], labels['doc_b'], labels['is_duplicate'].astype(bool)))
+        
+        if index is None:
+            index = build_document_index(full_precision, dtype)
+        report = quantization_recall(full_precision, dtype, self.doc_ids, labeled_pairs,
+                                     similarity_threshold, sample_size, index, quantized=quantized)
+        report['rounded_reference_chunks'] = rounded_chunks
+        print(f"Quantization check ({report['matrix_dtype']} document matrix, {report['bytes_per_vector']} bytes/vector, "
+              f"{report['compression']}x smaller): recall {report['recall']:.4f}"
+              + (f", precision {report['precision']:.4f}" if 'precision' in report else "")
+              + f", max similarity error {report['max_score_error']:.4f}; "
+              f"{report['index']} query recall@{report['k']} {report['index_recall_at_k']:.4f}")
+        if rounded_chunks:
+            print(f"Note: {rounded_chunks} chunk vectors of the reference came from the embedding cache, "
+                  f"already in {EMBEDDING_STORAGE_DTYPE}; rerun without the cache to include their rounding")
+        return report
+        
     def load_documents(self) -> List[Document]:
-        """Load documents from directory."""
+        """Load documents from directory, reading files in a process pool."""
+        from langchain.docstore.document import Document
         print("Loading documents...")
         
-        # You may need to adjust this based on your document formats
-        loader = DirectoryLoader(
-            self.document_dir, 
-            glob="**/*.txt",  # Update pattern based on your file types
-            loader_cls=TextLoader,
-            recursive=True
-        )
-        
-        # Fallback if the directory loader fails or for custom document types
         if not os.path.exists(self.document_dir):
             raise FileNotFoundError(f"Document directory {self.document_dir} not found")
-            
-        self.documents = loader.load()
+        
+        # Sorted paths keep document order, and therefore every later stage, deterministic
+        paths = sorted(str(p) for p in Path(self.document_dir).glob(DOCUMENT_GLOB) if p.is_file())
+        
+        self.documents = [
+            Document(page_content=text, metadata={'source': source})
+            for source, text in tqdm(parallel_map(_read_document, paths, self.n_workers, chunksize=64),
+                                     total=len(paths))
+        ]
         print(f"Loaded {len(self.documents)} documents")
         return self.documents
     
+    def prefilter_documents(self, near_duplicates: bool = True,
+                            near_duplicate_threshold: float = NEAR_DUPLICATE_THRESHOLD) -> Dict[str, List[str]]:
+        """
+        Lexical prefilter run before chunking and embedding.
+        Documents whose whitespace-normalized text is identical are collapsed to their
+        first occurrence; the others are recorded in self.exact_duplicates and restored
+        in the duplicate groups and reports. Optionally, MinHash with banded LSH over
+        word shingles finds near-duplicate pairs among the remaining documents, which
+        are stored in self.near_duplicate_pairs and merged into the duplicate groups.
+        """
+        print("Prefiltering exact and near-duplicate documents...")
+        representatives = []
+        representative_by_hash = {}
+        self.exact_duplicates = {}
+        for i, doc in enumerate(self.documents):
+            doc_id = doc.metadata.get('source', f"doc_{i}")
+            text_hash = hashlib.sha256(normalize_text(doc.page_content).encode('utf-8')).hexdigest()
+            if text_hash in representative_by_hash:
+                self.exact_duplicates.setdefault(representative_by_hash[text_hash], []).append(doc_id)
+            else:
+                representative_by_hash[text_hash] = doc_id
+                representatives.append(doc)
+        
+        collapsed = len(self.documents) - len(representatives)
+        self.documents = representatives
+        print(f"Collapsed {collapsed} exact duplicates into {len(self.exact_duplicates)} representatives")
+        
+        self.near_duplicate_pairs = []
+        if near_duplicates and len(self.documents) > 1:
+            self.near_duplicate_pairs = self._find_near_duplicate_pairs(near_duplicate_threshold)
+            print(f"Found {len(self.near_duplicate_pairs)} lexical near-duplicate pairs")
+        
+        return self.exact_duplicates
+    
+    def _find_near_duplicate_pairs(self, threshold: float) -> List[Tuple[str, str, float]]:
+        """Find document pairs whose estimated shingle Jaccard similarity reaches the threshold."""
+        rng = np.random.default_rng(42)
+        permutations = (rng.integers(1, 1 << 29, MINHASH_PERMUTATIONS, dtype=np.uint64),
+                        rng.integers(0, 1 << 29, MINHASH_PERMUTATIONS, dtype=np.uint64))
+        doc_ids = [doc.metadata.get('source', f"doc_{i}") for i, doc in enumerate(self.documents)]
+        signatures = np.vstack([minhash_signature(normalize_text(doc.page_content), permutations)
+                                for doc in tqdm(self.documents)])
+        
+        # Documents sharing any band of their signature become candidate pairs
+        rows_per_band = MINHASH_PERMUTATIONS // MINHASH_BANDS
+        candidates = set()
+        for band in range(MINHASH_BANDS):
+            buckets = {}
+            band_slice = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+            for i, key in enumerate(map(bytes, band_slice)):
+                buckets.setdefault(key, []).append(i)
+            for members in buckets.values():
+                for pos, i in enumerate(members):
+                    for j in members[pos + 1:]:
+                        candidates.add((i, j))
+        
+        # Verify candidates against the full signature
+        pairs = []
+        for i, j in sorted(candidates):
+            jaccard = float(np.mean(signatures[i] == signatures[j]))
+            if jaccard >= threshold:
+                pairs.append((doc_ids[i], doc_ids[j], jaccard))
+        return pairs
+    
     def chunk_documents(self) -> List[Document]:
-        """Split documents into smaller chunks."""
+        """
+        Split documents into smaller chunks, one document per task in a process pool.
+        Chunks of a document are contiguous; self.chunk_ranges maps each source to its
+        [start, end) slice of self.chunks.
+        """
+        from langchain.docstore.document import Document
         print("Chunking documents...")
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP,
-            separators=["\n\n", "\n", ".", " ", ""]
-        )
+        tasks = [(doc.metadata.get('source', 'unknown'), doc.page_content, CHUNK_SIZE, CHUNK_OVERLAP)
+                 for doc in self.documents]
         
         self.chunks = []
-        for doc in tqdm(self.documents):
-            # Store the original document name/path in the metadata
-            doc_chunks = text_splitter.split_documents([doc])
-            for chunk in doc_chunks:
-                # Ensure we track the document source for each chunk
-                if 'source' not in chunk.metadata:
-                    chunk.metadata['source'] = doc.metadata.get('source', 'unknown')
-            self.chunks.extend(doc_chunks)
+        self.chunk_ranges = {}
+        for (source, _, _, _), records in zip(tasks, tqdm(parallel_map(_split_document, tasks, self.n_workers),
+                                                          total=len(tasks))):
+            if records:
+                self.chunk_ranges[source] = (len(self.chunks), len(self.chunks) + len(records))
+            # Ensure we track the document source and offset for each chunk
+            self.chunks.extend(
+                Document(page_content=record.text,
+                         metadata={'source': record.source, 'start_index': record.offset})
+                for record in records
+            )
             
         print(f"Created {len(self.chunks)} chunks from {len(self.documents)} documents")
         return self.chunks
+    
+    def save_ingest(self):
+        """
+        Persist prefilter results and chunks, so embedding can run in a later process.
+        Analysis results of the previously ingested corpus are removed.
+        """
+        self.store.clear_analysis()
+        self.store.save_json(EmbeddingStore.INGEST_FILE, {
+            'documents': [doc.metadata.get('source', f"doc_{i}") for i, doc in enumerate(self.documents)],
+            'exact_duplicates': self.exact_duplicates,
+            'near_duplicate_pairs': self.near_duplicate_pairs,
+        })
+        self.store.save_jsonl(EmbeddingStore.CHUNK_TEXT_FILE,
+                              ((chunk.metadata['source'], chunk.metadata.get('start_index', -1), chunk.page_content)
+                               for chunk in self.chunks))
+        print(f"Saved {len(self.documents)} documents and {len(self.chunks)} chunks to {self.store.store_dir}")
+    
+    def load_ingest(self, with_chunks: bool = True):
+        """
+        Restore what save_ingest wrote. Documents come back without their text (the
+        chunks carry it); with_chunks=False only restores the prefilter results.
+        """
+        from langchain.docstore.document import Document
+        ingest = self.store.load_json(EmbeddingStore.INGEST_FILE)
+        if ingest is None:
+            raise FileNotFoundError(f"No ingested documents in {self.store.store_dir}; run the ingest stage first")
+        self.exact_duplicates = ingest['exact_duplicates']
+        self.near_duplicate_pairs = [tuple(pair) for pair in ingest['near_duplicate_pairs']]
+        self.documents = [Document(page_content="", metadata={'source': source}) for source in ingest['documents']]
+        if not with_chunks:
+            return
         
-    def initialize_embeddings(self):
-        """Initialize the embedding model."""
-        print(f"Initializing embedding model: {self.embedding_model_name}")
-        self.embedding_model = HuggingFaceEmbeddings(
-            model_name=self.embedding_model_name,
-            model_kwargs={'device': 'cuda' if os.environ.get('CUDA_VISIBLE_DEVICES') else 'cpu'}
-        )
+        self.chunks = []
+        self.chunk_ranges = {}
+        for source, offset, text in self.store.load_jsonl(EmbeddingStore.CHUNK_TEXT_FILE):
+            start, _ = self.chunk_ranges.get(source, (len(self.chunks), None))
+            self.chunk_ranges[source] = (start, len(self.chunks) + 1)
+            self.chunks.append(Document(page_content=text, metadata={'source': source, 'start_index': offset}))
+        print(f"Restored {len(self.documents)} documents and {len(self.chunks)} chunks")
         
-    def embed_documents(self, use_cached: bool = True) -> Dict[str, np.ndarray]:
-        """Generate embeddings for all document chunks."""
-        # Try to load cached embeddings if allowed
-        if use_cached and os.path.exists(EMBEDDING_CACHE_PATH):
-            print(f"Loading cached embeddings from {EMBEDDING_CACHE_PATH}")
-            with open(EMBEDDING_CACHE_PATH, 'rb') as f:
-                self.document_embeddings = pickle.load(f)
-            return self.document_embeddings
+    def initialize_embeddings(self, batch_size: int = EMBEDDING_BATCH_SIZE):
+        """Initialize the embedding backend, replacing one created with another batch size."""
+        if self.embedding_model is not None:
+            self.embedding_model.close()
+        self.embedding_model = load_embedding_model(self.embedding_model_name, self.embedding_backend,
+                                                    batch_size)
+    
+    def embedding_meta(self) -> Dict[str, str]:
+        """Backend, model and cache key of the embeddings, recorded in the store for the query side."""
+        return {'backend': self.embedding_backend, 'model': self.embedding_model_name,
+                'embedding_key': self.embedding_model.cache_key}
+    
+    def open_embedding_cache(self) -> EmbeddingCache:
+        """Open the chunk embedding cache kept in this detector's embedding store."""
+        os.makedirs(self.store.store_dir, exist_ok=True)
+        return EmbeddingCache(self.store.artifact_path(EmbeddingStore.CACHE_FILE),
+                              self.embedding_model.cache_key, CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_STORAGE_DTYPE)
         
+    def embed_documents(self, use_cached: bool = True, batch_size: int = EMBEDDING_BATCH_SIZE,
+                        keep_chunk_vectors: bool = False) -> Dict[str, np.ndarray]:
+        """
+        Generate embeddings for all document chunks.
+        Every chunk is embedded exactly once, in batches of batch_size; the FAISS
+        index and the per-document mean vectors are both built from those vectors.
+        Chunk vectors are read from and written to the EmbeddingCache, so reruns only
+        embed new or changed chunks. Pass use_cached=False to force a full re-embed.
+        keep_chunk_vectors=True also persists the chunk vectors in the embedding store,
+        so passage analysis can run later in another process.
+        """
         print("Generating document embeddings...")
-        if not self.embedding_model:
-            self.initialize_embeddings()
+        if not self.embedding_model or self.embedding_model.batch_size != batch_size:
+            self.initialize_embeddings(batch_size)
             
-        # Create FAISS index for efficient similarity search
-        self.faiss_index = FAISS.from_documents(self.chunks, self.embedding_model)
+        chunk_texts = [chunk.page_content for chunk in self.chunks]
+        chunk_hashes = [EmbeddingCache.content_hash(text) for text in chunk_texts]
+        
+        # Look up vectors for chunks we have already embedded with this model and chunking
+        cache = self.open_embedding_cache()
+        unique_hashes = list(dict.fromkeys(chunk_hashes))
+        vectors_by_hash = cache.get_many(unique_hashes) if use_cached else {}
+        
+        # Embed only new or changed chunks, in batches
+        missing = {}
+        for text, content_hash in zip(chunk_texts, chunk_hashes):
+            if content_hash not in vectors_by_hash:
+                missing.setdefault(content_hash, text)
+        print(f"{len(unique_hashes) - len(missing)} chunks cached, {len(missing)} to embed")
         
-        # Extract embeddings for each document
-        self.document_embeddings = {}
-        for i, doc in enumerate(tqdm(self.documents)):
+        # A pool backend gets one batch per worker per call
+        missing_items = list(missing.items())
+        step = batch_size * self.embedding_model.parallelism
+        # Unquantized model output, the reference of the quantization check
+        model_vectors = {}
+        for start in tqdm(range(0, len(missing_items), step)):
+            batch = missing_items[start:start + step]
+            vectors = self.embedding_model.embed_documents([text for _, text in batch])
+            entries = [(content_hash, np.asarray(vector, dtype=np.float32))
+                       for (content_hash, _), vector in zip(batch, vectors)]
+            vectors_by_hash.update(cache.put_many(entries))
+            if EMBEDDING_STORAGE_DTYPE != 'float32':
+                model_vectors.update(entries)
+        self.embedding_model.report_throughput()
+        
+        # Drop entries for chunks of deleted or changed documents
+        evicted = cache.evict_except(set(unique_hashes))
+        if evicted:
+            print(f"Evicted {evicted} stale cache entries")
+        cache.close()
+        
+        if chunk_hashes:
+            self.chunk_embeddings = np.vstack([vectors_by_hash[h] for h in chunk_hashes])
+        else:
+            self.chunk_embeddings = np.empty((0, 0), dtype=np.float32)
+        
+        # Create FAISS index for efficient similarity search from the same vectors.
+        # Vectors are L2-normalized so distances convert to cosine similarity.
+        self.faiss_index = build_chunk_vectorstore(chunk_texts, self.chunk_embeddings,
+                                                   [chunk.metadata for chunk in self.chunks],
+                                                   self.embedding_model, EMBEDDING_STORAGE_DTYPE)
+        self.faiss_index.save_local(self.store.chunk_faiss_dir)
+        
+        # Extract embeddings for each document from its contiguous range of chunk rows
+        doc_ids = []
+        ranges = []
+        for i, doc in enumerate(self.documents):
             # Get source path to use as unique identifier
             doc_id = doc.metadata.get('source', f"doc_{i}")
-            
-            # Find chunks belonging to this document
-            doc_chunks = [c for c in self.chunks if c.metadata.get('source') == doc_id]
-            
-            if not doc_chunks:
+            if doc_id not in self.chunk_ranges:
                 print(f"Warning: No chunks found for document {doc_id}")
                 continue
-                
-            # Get embeddings for all chunks
-            chunk_texts = [chunk.page_content for chunk in doc_chunks]
-            chunk_embeddings = self.embedding_model.embed_documents(chunk_texts)
+            doc_ids.append(doc_id)
+            ranges.append(self.chunk_ranges[doc_id])
+        
+        # Average the chunk embeddings to get document-level embeddings in one segment reduction
+        ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+        doc_vectors = segment_mean(self.chunk_embeddings, ranges)
+            
+        # Persist the document matrix and map it back, so every stage reads the same array
+        self.store.save(doc_ids, doc_vectors, EMBEDDING_STORAGE_DTYPE, meta=self.embedding_meta())
+        self.load_embeddings()
+        doc_index = build_document_index(self.embedding_matrix, EMBEDDING_STORAGE_DTYPE)
+        self.store.save_doc_index(doc_index)
+        if EMBEDDING_STORAGE_DTYPE != 'float32' and len(doc_ids) > 1:
+            # Chunks served by the cache only exist quantized; they enter the reference as stored
+            reference = np.vstack([model_vectors.get(h, vectors_by_hash[h]) for h in chunk_hashes])
+            self.evaluate_quantization(EMBEDDING_STORAGE_DTYPE, full_precision=segment_mean(reference, ranges),
+                                       index=doc_index, quantized=self.embedding_matrix,
+                                       rounded_chunks=sum(h not in model_vectors for h in chunk_hashes))
+            del reference
+        model_vectors.clear()
+        if keep_chunk_vectors:
+            self.store.save_chunks([(chunk.metadata.get('source'), chunk.metadata.get('start_index', -1))
+                                    for chunk in self.chunks], self.chunk_embeddings, EMBEDDING_STORAGE_DTYPE)
+        else:
+            # Chunk vectors of an earlier run belong to another corpus
+            self.store.clear_chunks(vectorstore=False)
+            
+        print(f"Generated embeddings for {len(self.doc_ids)} documents")
+        return self.document_embeddings
+    
+    def run_streaming_embedding(self, batch_size: int = EMBEDDING_BATCH_SIZE,
+                                queue_size: int = STREAM_QUEUE_SIZE,
+                                keep_chunk_vectors: bool = False,
+                                use_cached: bool = True) -> Dict[str, np.ndarray]:
+        """
+        Load, chunk and embed the corpus as a stream with bounded memory.
+        A producer thread reads and splits files in the process pool (with a bounded
+        number of pending tasks) and feeds chunk batches through a queue of queue_size
+        batches; the embedding loop consumes them, so a slow model applies back-pressure
+        all the way to file reading. Neither self.documents nor self.chunks is filled:
+        only per-document running sums are held until a document's last chunk is
+        embedded, and the means are appended to disk. Exact duplicates are collapsed on
+        the fly; MinHash near-duplicate detection is not run in this mode. With
+        keep_chunk_vectors, chunk vectors and their (source, offset) index are written to
+        the embedding store as well.
+        """
+        print("Streaming load -> chunk -> embed...")
+        if not os.path.exists(self.document_dir):
+            raise FileNotFoundError(f"Document directory {self.document_dir} not found")
+        if not self.embedding_model or self.embedding_model.batch_size != batch_size:
+            self.initialize_embeddings(batch_size)
+        
+        paths = sorted(str(p) for p in Path(self.document_dir).glob(DOCUMENT_GLOB) if p.is_file())
+        tasks = [(path, CHUNK_SIZE, CHUNK_OVERLAP) for path in paths]
+        batches = queue.Queue(maxsize=queue_size)
+        batch_rows = batch_size * self.embedding_model.parallelism
+        self.exact_duplicates = {}
+        self.near_duplicate_pairs = []
+        
+        def produce():
+            # Items are (source, chunks in that document, record)
+            representative_by_hash = {}
+            batch = []
+            try:
+                for source, text_hash, records in parallel_map(_load_and_split, tasks, self.n_workers,
+                                                               max_pending=4 * max(self.n_workers, 1)):
+                    if text_hash in representative_by_hash:
+                        self.exact_duplicates.setdefault(representative_by_hash[text_hash], []).append(source)
+                        continue
+                    representative_by_hash[text_hash] = source
+                    if not records:
+                        print(f"Warning: No chunks found for document {source}")
+                    for record in records:
+                        batch.append((source, len(records), record))
+                        if len(batch) >= batch_rows:
+                            batches.put(batch)
+                            batch = []
+                if batch:
+                    batches.put(batch)
+                batches.put(None)
+            except BaseException as exc:
+                batches.put(exc)
+        
+        producer = threading.Thread(target=produce, name="chunk-producer", daemon=True)
+        producer.start()
+        
+        cache = self.open_embedding_cache()
+        live_hashes = set()
+        in_progress = {}  # source -> [vector sum, chunks seen, chunks expected, model output sum]
+        doc_ids = []
+        dim = 0
+        embedded = 0
+        # Quantized stores are checked against means of the unquantized model output
+        check_quantization = EMBEDDING_STORAGE_DTYPE != 'float32'
+        rounded_chunks = 0
+        # Spill files live next to the store so installing them is a rename, not a copy
+        os.makedirs(self.store.store_dir, exist_ok=True)
+        with tempfile.TemporaryDirectory(prefix="stream_embed_", dir=self.store.store_dir) as tmp_dir:
+            doc_raw_path = os.path.join(tmp_dir, "doc_vectors.f32")
+            chunk_raw_path = os.path.join(tmp_dir, "chunk_vectors.f32")
+            chunk_index_path = os.path.join(tmp_dir, "chunk_index.jsonl")
+            reference_raw_path = os.path.join(tmp_dir, "reference_vectors.f32")
+            with open(doc_raw_path, 'wb') as doc_raw, \
+                 (open(reference_raw_path, 'wb') if check_quantization else contextlib.nullcontext()) as reference_raw, \
+                 (open(chunk_raw_path, 'wb') if keep_chunk_vectors else contextlib.nullcontext()) as chunk_raw, \
+                 (open(chunk_index_path, 'w', encoding='utf-8') if keep_chunk_vectors else contextlib.nullcontext()) as chunk_index:
+                progress = tqdm(unit="chunks")
+                while True:
+                    batch = batches.get()
+                    if isinstance(batch, BaseException):
+                        raise batch
+                    if batch is None:
+                        break
+                    
+                    # Embed only chunks the cache has not seen
+                    hashes = [EmbeddingCache.content_hash(record.text) for _, _, record in batch]
+                    live_hashes.update(hashes)
+                    vectors_by_hash = cache.get_many(list(set(hashes))) if use_cached else {}
+                    missing = {}
+                    for (_, _, record), content_hash in zip(batch, hashes):
+                        if content_hash not in vectors_by_hash:
+                            missing.setdefault(content_hash, record.text)
+                    model_vectors = {}
+                    if missing:
+                        vectors = self.embedding_model.embed_documents(list(missing.values()))
+                        entries = [(h, np.asarray(v, dtype=np.float32)) for h, v in zip(missing, vectors)]
+                        vectors_by_hash.update(cache.put_many(entries))
+                        embedded += len(entries)
+                        if check_quantization:
+                            model_vectors = dict(entries)
+                    
+                    for (source, expected, record), content_hash in zip(batch, hashes):
+                        vector = vectors_by_hash[content_hash]
+                        dim = len(vector)
+                        if keep_chunk_vectors:
+                            chunk_raw.write(vector.tobytes())
+                            chunk_index.write(json.dumps([record.source, record.offset]) + "\n")
+                        state = in_progress.setdefault(source, [np.zeros(dim, dtype=np.float64), 0, expected,
+                                                                np.zeros(dim, dtype=np.float64)])
+                        state[0] += vector
+                        state[1] += 1
+                        if check_quantization:
+                            # Chunks served by the cache only exist quantized
+                            if content_hash not in model_vectors:
+                                rounded_chunks += 1
+                            state[3] += model_vectors.get(content_hash, vector)
+                        # Document complete: write its mean and forget it
+                        if state[1] == state[2]:
+                            doc_raw.write((state[0] / state[1]).astype(np.float32).tobytes())
+                            if check_quantization:
+                                reference_raw.write((state[3] / state[1]).astype(np.float32).tobytes())
+                            doc_ids.append(source)
+                            del in_progress[source]
+                    progress.update(len(batch))
+                progress.close()
+            producer.join()
+            self.embedding_model.report_throughput()
             
-            # Average the chunk embeddings to get a document-level embedding
-            doc_embedding = np.mean(chunk_embeddings, axis=0)
-            self.document_embeddings[doc_id] = doc_embedding
+            evicted = cache.evict_except(live_hashes)
+            if evicted:
+                print(f"Evicted {evicted} stale cache entries")
+            cache.close()
             
-        # Cache the embeddings
-        with open(EMBEDDING_CACHE_PATH, 'wb') as f:
-            pickle.dump(self.document_embeddings, f)
+            self.store.save_streamed(doc_ids, doc_raw_path, dim, EMBEDDING_STORAGE_DTYPE,
+                                     meta=self.embedding_meta())
+            # No chunk FAISS store is built while streaming; drop one from an earlier
+            # run, along with older chunk vectors unless they are replaced here
+            self.store.clear_chunks(vectors=not keep_chunk_vectors)
+            if keep_chunk_vectors:
+                self.store.save_chunks_streamed(chunk_raw_path, chunk_index_path, dim, EMBEDDING_STORAGE_DTYPE)
             
-        print(f"Generated embeddings for {len(self.document_embeddings)} documents")
+            self.load_embeddings()
+            doc_index = build_document_index(self.embedding_matrix, EMBEDDING_STORAGE_DTYPE)
+            self.store.save_doc_index(doc_index)
+            if check_quantization and len(doc_ids) > 1:
+                full_precision = np.memmap(reference_raw_path, dtype=np.float32, mode='r', shape=(len(doc_ids), dim))
+                self.evaluate_quantization(EMBEDDING_STORAGE_DTYPE, full_precision=full_precision, index=doc_index,
+                                           rounded_chunks=rounded_chunks, quantized=self.embedding_matrix)
+                del full_precision
+        
+        collapsed = sum(len(m) for m in self.exact_duplicates.values())
+        print(f"Streamed {len(doc_ids)} documents ({embedded} chunks embedded, "
+              f"{collapsed} exact duplicates collapsed)")
         return self.document_embeddings
     
-    def compute_similarity_matrix(self) -> np.ndarray:
-        """Compute pairwise similarity matrix between documents."""
+    def compute_similarity_matrix(self, mode: str = SIMILARITY_MODE,
+                                  similarity_threshold: float = SIMILARITY_THRESHOLD,
+                                  top_k: int = ANN_TOP_K):
+        """
+        Compute pairwise similarity between documents.
+        mode="dense" returns the full n x n matrix; mode="ann" and mode="blocked" return a
+        sparse graph holding only the pairs above similarity_threshold (approximate and
+        exact respectively, see build_ann_similarity_graph / build_blocked_similarity_graph).
+        """
+        from sklearn.metrics.pairwise import cosine_similarity
+        # Drop similarities from an earlier run (or restored by load_analysis), so
+        # similarity_edges reads only what this call computes
+        self.similarity_matrix = None
+        self.similarity_graph = None
+        if mode == 'ann':
+            return self.build_ann_similarity_graph(similarity_threshold, top_k)
+        if mode == 'blocked':
+            return self.build_blocked_similarity_graph(similarity_threshold)
+        if mode != 'dense':
+            raise ValueError(f"Unknown similarity mode: {mode}")
+        
         print("Computing similarity matrix...")
-        doc_ids = list(self.document_embeddings.keys())
-        embeddings = np.array(list(self.document_embeddings.values()))
+        embeddings = self.embedding_matrix
         
         # Compute cosine similarity
         self.similarity_matrix = cosine_similarity(embeddings)
@@ -150,96 +1532,438 @@ class DuplicateDetector:
         print(f"Computed {self.similarity_matrix.shape[0]}x{self.similarity_matrix.shape[1]} similarity matrix")
         return self.similarity_matrix
     
-    def perform_hierarchical_clustering(self, method: str = 'ward', 
-                                       distance_threshold: float = 0.5) -> Dict[str, int]:
+    def _normalized_embeddings(self) -> np.ndarray:
+        """Return an L2-normalized float32 copy of the embedding matrix."""
+        embeddings = np.array(self.embedding_matrix, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        embeddings /= norms
+        return embeddings
+    
+    def build_ann_similarity_graph(self, similarity_threshold: float = SIMILARITY_THRESHOLD,
+                                   top_k: int = ANN_TOP_K) -> sparse.csr_matrix:
         """
-        Perform hierarchical clustering on document embeddings.
-        Returns a dictionary mapping document IDs to cluster labels.
+        Build a sparse, symmetric cosine-similarity graph with a FAISS HNSW index.
+        Each document keeps its top_k nearest neighbours scoring at least
+        similarity_threshold; memory scales with n * top_k instead of n^2.
         """
-        print(f"Performing hierarchical clustering using {method} linkage...")
-        doc_ids = list(self.document_embeddings.keys())
-        embeddings = np.array(list(self.document_embeddings.values()))
+        from scipy import sparse
+        print(f"Building ANN similarity graph (top {top_k} neighbours per document)...")
+        embeddings = self._normalized_embeddings()
+        n_docs = len(embeddings)
+        scores, neighbours = self._knn_search(embeddings, top_k)
+        rows = np.repeat(np.arange(n_docs), neighbours.shape[1])
+        cols = neighbours.ravel()
+        scores = scores.ravel()
+        keep = (cols >= 0) & (cols != rows) & (scores >= similarity_threshold)
         
-        # Compute the linkage matrix
-        Z = linkage(embeddings, method=method)
+        graph = sparse.coo_matrix((scores[keep], (rows[keep], cols[keep])),
+                                  shape=(n_docs, n_docs)).tocsr()
+        # Neighbour lists are not symmetric; keep an edge if either side found it
+        self.similarity_graph = graph.maximum(graph.T).tocsr()
         
-        # Form flat clusters from the hierarchical clustering
-        labels = fcluster(Z, t=distance_threshold, criterion='distance')
+        print(f"Similarity graph has {self.similarity_graph.nnz // 2} edges above {similarity_threshold}")
+        return self.similarity_graph
+    
+    @staticmethod
+    def _knn_search(embeddings: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search each normalized row's top_k neighbours (plus itself) with a FAISS HNSW
+        inner-product index. Returns (scores, neighbours), each n x (top_k + 1).
+        """
+        import faiss
+        n_docs, dim = embeddings.shape
+        index = faiss.IndexHNSWFlat(dim, ANN_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = max(2 * top_k, 64)
+        index.add(embeddings)
         
-        # Map document IDs to their cluster labels
-        self.document_clusters = {doc_id: label for doc_id, label in zip(doc_ids, labels)}
+        # Ask for one extra neighbour because every document finds itself
+        return index.search(embeddings, min(top_k + 1, n_docs))
+    
+    def _row_norms(self, block_size: int = SIMILARITY_BLOCK_SIZE) -> np.ndarray:
+        """L2 norm of every embedding row, read block by block; zero norms become 1."""
+        embeddings = self.embedding_matrix
+        norms = np.empty(len(embeddings), dtype=np.float32)
+        for start in range(0, len(embeddings), block_size):
+            norms[start:start + block_size] = np.linalg.norm(
+                np.asarray(embeddings[start:start + block_size], dtype=np.float32), axis=1)
+        norms[norms == 0] = 1
+        return norms
+    
+    def build_blocked_similarity_graph(self, similarity_threshold: float = SIMILARITY_THRESHOLD,
+                                       block_size: int = SIMILARITY_BLOCK_SIZE,
+                                       n_threads: Optional[int] = None,
+                                       spill_dir: Optional[str] = None,
+                                       max_edges_in_memory: int = MAX_EDGES_IN_MEMORY) -> sparse.csr_matrix:
+        """
+        Compute exact cosine similarity tile by tile and keep only pairs above the threshold.
+        Tiles are read straight from the (memory-mapped) embedding matrix and normalized on
+        the fly, so peak memory is O(block_size^2 + block_size * dim) plus the kept edges.
+        Each tile is one float32 matrix product, parallelized by BLAS across n_threads
+        (needs threadpoolctl; otherwise the BLAS default is used). Once more than
+        max_edges_in_memory edges are buffered they are spilled to spill_dir (a temporary
+        directory if not given). The symmetric graph is then assembled part by part
+        (see symmetric_csr_from_edges), so spilled edges are never loaded all at once.
+        """
+        embeddings = self.embedding_matrix
+        n_docs, dim = embeddings.shape
+        print(f"Computing blocked exact similarity ({block_size} x {block_size} tiles)...")
         
-        # Count documents per cluster
-        cluster_counts = {}
-        for label in labels:
-            if label not in cluster_counts:
-                cluster_counts[label] = 0
-            cluster_counts[label] += 1
+        # Row norms in one streaming pass, so tiles can be normalized without a full copy
+        norms = self._row_norms(block_size)
+        
+        def normalized_block(start):
+            block = np.asarray(embeddings[start:start + block_size], dtype=np.float32)
+            return block / norms[start:start + block_size, None]
+        
+        spill_parts = []
+        spill_tmp = None
+        buffered = []
+        buffered_edges = 0
+        
+        def spill():
+            nonlocal spill_tmp, buffered, buffered_edges
+            target = spill_dir
+            if target is None:
+                spill_tmp = spill_tmp or tempfile.TemporaryDirectory(prefix="similarity_spill_")
+                target = spill_tmp.name
+            os.makedirs(target, exist_ok=True)
+            part_path = os.path.join(target, f"edges_{len(spill_parts):05d}.npz")
+            np.savez(part_path,
+                     rows=np.concatenate([b[0] for b in buffered]),
+                     cols=np.concatenate([b[1] for b in buffered]),
+                     scores=np.concatenate([b[2] for b in buffered]))
+            spill_parts.append(part_path)
+            buffered = []
+            buffered_edges = 0
+        
+        if threadpool_limits is not None and n_threads:
+            blas_threads = threadpool_limits(limits=n_threads, user_api='blas')
+        else:
+            blas_threads = contextlib.nullcontext()
+        start_time = time.perf_counter()
+        with blas_threads:
+            block_starts = list(range(0, n_docs, block_size))
+            for i in tqdm(block_starts):
+                row_block = normalized_block(i)
+                # Only tiles on or above the diagonal; similarity is symmetric
+                for j in block_starts:
+                    if j < i:
+                        continue
+                    col_block = row_block if j == i else normalized_block(j)
+                    tile = row_block @ col_block.T
+                    rows, cols = np.nonzero(tile >= similarity_threshold)
+                    scores = tile[rows, cols]
+                    rows = rows.astype(np.int64) + i
+                    cols = cols.astype(np.int64) + j
+                    keep = rows < cols
+                    if keep.any():
+                        buffered.append((rows[keep], cols[keep], scores[keep]))
+                        buffered_edges += int(keep.sum())
+                    if buffered_edges > max_edges_in_memory:
+                        spill()
+        elapsed = time.perf_counter() - start_time
+        
+        # Edges still buffered become one part, read after the spilled ones
+        if buffered:
+            buffered = [tuple(np.concatenate([b[k] for b in buffered]) for k in range(3))]
+        
+        def edge_parts():
+            for part_path in spill_parts:
+                with np.load(part_path) as part:
+                    yield part['rows'], part['cols'], part['scores']
+            yield from buffered
+        
+        self.similarity_graph = symmetric_csr_from_edges(edge_parts, n_docs)
+        if spill_tmp is not None:
+            spill_tmp.cleanup()
+        
+        # Report multi-core throughput of the tiled computation
+        pairs = n_docs * (n_docs - 1) / 2
+        gflops = 2.0 * pairs * dim / max(elapsed, 1e-9) / 1e9
+        print(f"Scored {pairs:,.0f} pairs in {elapsed:.1f}s "
+              f"({pairs / max(elapsed, 1e-9):,.0f} pairs/s, {gflops:.1f} GFLOP/s)")
+        if spill_parts:
+            print(f"Spilled {len(spill_parts)} edge parts to disk")
+        print(f"Similarity graph has {self.similarity_graph.nnz // 2} edges above {similarity_threshold}")
+        return self.similarity_graph
+    
+    def _ensure_similarity(self):
+        """Compute similarities if neither the dense matrix nor the sparse graph exists."""
+        if self.similarity_matrix is None and self.similarity_graph is None:
+            self.compute_similarity_matrix()
+    
+    def similarity_edges(self, similarity_threshold: float = SIMILARITY_THRESHOLD) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Return (rows, cols, scores) for every document pair i < j at or above the threshold,
+        read from the sparse graph when available, otherwise from the dense matrix.
+        """
+        from scipy import sparse
+        self._ensure_similarity()
+        if self.similarity_graph is not None:
+            upper = sparse.triu(self.similarity_graph, k=1).tocoo()
+            keep = upper.data >= similarity_threshold
+            return upper.row[keep], upper.col[keep], upper.data[keep]
+        
+        rows, cols = np.nonzero(np.triu(self.similarity_matrix >= similarity_threshold, k=1))
+        return rows, cols, self.similarity_matrix[rows, cols]
+    
+    def perform_hierarchical_clustering(self, method: str = 'ward', 
+                                       distance_threshold: float = 0.5,
+                                       backend: str = CLUSTERING_BACKEND) -> Dict[str, int]:
+        """
+        Cluster document embeddings with the selected backend.
+        - "hierarchical": scipy linkage with the given method, cut at distance_threshold.
+          Needs O(n^2) memory; fine up to tens of thousands of documents.
+        - "knn_graph": Louvain communities on the k-NN graph from the FAISS ANN index.
+        - "birch": streaming BIRCH over normalized embeddings, fed in batches.
+        Returns a dictionary mapping document IDs to cluster labels (starting at 1).
+        """
+        from scipy.cluster.hierarchy import linkage, fcluster
+        if backend == 'hierarchical':
+            print(f"Performing hierarchical clustering using {method} linkage...")
+            # Compute the linkage matrix
+            self.linkage_matrix = linkage(self.embedding_rows(), method=method)
             
-        print(f"Found {len(set(labels))} clusters")
-        print(f"Largest cluster has {max(cluster_counts.values())} documents")
-        print(f"Smallest cluster has {min(cluster_counts.values())} documents")
+            # Form flat clusters from the hierarchical clustering
+            labels = fcluster(self.linkage_matrix, t=distance_threshold, criterion='distance')
+        elif backend == 'knn_graph':
+            labels = self._cluster_knn_graph()
+        elif backend == 'birch':
+            labels = self._cluster_birch()
+        else:
+            raise ValueError(f"Unknown clustering backend: {backend}")
+        
+        # Map document IDs to their cluster labels
+        self.document_clusters = {doc_id: int(label) for doc_id, label in zip(self.doc_ids, labels)}
+        self.cluster_stats = self._report_cluster_sizes(np.asarray(labels))
         
         return self.document_clusters
     
+    def _cluster_knn_graph(self, top_k: int = CLUSTER_KNN_K,
+                           min_similarity: float = CLUSTER_KNN_SIMILARITY) -> np.ndarray:
+        """Label documents by Louvain community on their approximate k-NN graph."""
+        import networkx as nx
+        print(f"Clustering k-NN graph ({top_k} neighbours per document)...")
+        embeddings = self._normalized_embeddings()
+        n_docs = len(embeddings)
+        scores, neighbours = self._knn_search(embeddings, top_k)
+        
+        G = nx.Graph()
+        G.add_nodes_from(range(n_docs))
+        rows = np.repeat(np.arange(n_docs), neighbours.shape[1])
+        cols = neighbours.ravel()
+        weights = scores.ravel()
+        keep = (cols >= 0) & (cols != rows) & (weights >= min_similarity)
+        G.add_weighted_edges_from(zip(rows[keep].tolist(), cols[keep].tolist(), weights[keep].tolist()))
+        
+        labels = np.zeros(n_docs, dtype=np.int64)
+        communities = nx.community.louvain_communities(G, weight='weight', seed=42)
+        # Number communities by their smallest member so labels are stable across runs
+        for label, community in enumerate(sorted(communities, key=min), start=1):
+            labels[list(community)] = label
+        return labels
+    
+    def _cluster_birch(self, threshold: float = CLUSTER_BIRCH_THRESHOLD,
+                       batch_size: int = CLUSTER_BATCH_SIZE) -> np.ndarray:
+        """Label documents with BIRCH, streaming the embedding matrix in batches."""
+        from sklearn.cluster import Birch
+        print(f"Clustering with streaming BIRCH (threshold {threshold})...")
+        embeddings = self.embedding_matrix
+        
+        def normalized_batch(start):
+            batch = np.asarray(embeddings[start:start + batch_size], dtype=np.float32)
+            norms = np.linalg.norm(batch, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            return batch / norms
+        
+        # n_clusters=None keeps the CF-tree subclusters as the final clusters
+        birch = Birch(threshold=threshold, n_clusters=None)
+        for start in tqdm(range(0, len(embeddings), batch_size)):
+            birch.partial_fit(normalized_batch(start))
+        labels = np.concatenate([birch.predict(normalized_batch(start))
+                                 for start in range(0, len(embeddings), batch_size)])
+        return labels + 1
+    
+    def _report_cluster_sizes(self, labels: np.ndarray) -> Dict[str, float]:
+        """Print and return cluster-size statistics."""
+        _, counts = np.unique(labels, return_counts=True)
+        stats = {
+            'clusters': int(len(counts)),
+            'largest': int(counts.max()) if len(counts) else 0,
+            'smallest': int(counts.min()) if len(counts) else 0,
+            'median': float(np.median(counts)) if len(counts) else 0.0,
+            'singletons': int((counts == 1).sum()),
+        }
+        print(f"Found {stats['clusters']} clusters")
+        print(f"Largest cluster has {stats['largest']} documents")
+        print(f"Smallest cluster has {stats['smallest']} documents")
+        print(f"Median cluster size is {stats['median']:g}; {stats['singletons']} singleton clusters")
+        return stats
+    
     def find_duplicate_groups(self, similarity_threshold: float = SIMILARITY_THRESHOLD) -> List[Set[str]]:
-        """Find groups of similar/duplicate documents."""
-        if self.similarity_matrix is None:
-            self.compute_similarity_matrix()
-            
-        doc_ids = list(self.document_embeddings.keys())
-        duplicate_groups = []
+        """
+        Find groups of similar/duplicate documents.
+        Groups are the connected components of the graph of pairs at or above the
+        threshold, so A~B and B~C always end up in one group regardless of order.
+        Runs in O(documents + edges); groups are ordered by their first document.
+        Lexical near-duplicate pairs from prefilter_documents() are added as edges, and
+        collapsed exact duplicates are restored next to their representative.
+        """
+        from scipy import sparse
+        from scipy.sparse.csgraph import connected_components
+        doc_ids = self.doc_ids
+        rows, cols, _ = self.similarity_edges(similarity_threshold)
+        if self.near_duplicate_pairs:
+            position = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+            lexical = [(position[a], position[b]) for a, b, _ in self.near_duplicate_pairs
+                       if a in position and b in position]
+            if lexical:
+                rows = np.concatenate([rows, [i for i, _ in lexical]])
+                cols = np.concatenate([cols, [j for _, j in lexical]])
         
-        # Track which documents have been processed
-        processed_docs = set()
+        # Label every document with its connected component
+        adjacency = sparse.coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)),
+                                      shape=(len(doc_ids), len(doc_ids)))
+        _, labels = connected_components(adjacency, directed=False)
         
-        for i in range(len(doc_ids)):
-            if doc_ids[i] in processed_docs:
-                continue
-                
-            # Find all documents similar to the current one
-            similar_indices = np.where(self.similarity_matrix[i] >= similarity_threshold)[0]
-            
-            if len(similar_indices) > 0:
-                similar_docs = {doc_ids[i]}  # Include the source document
-                for idx in similar_indices:
-                    similar_docs.add(doc_ids[idx])
-                
-                # Only consider as duplicates if there's more than one document
-                if len(similar_docs) > 1:
-                    duplicate_groups.append(similar_docs)
-                    processed_docs.update(similar_docs)
+        # Collect components with more than one document, in document order
+        sizes = np.bincount(labels)
+        grouped = sizes[labels] > 1
+        for idx, doc_id in enumerate(doc_ids):
+            if doc_id in self.exact_duplicates:
+                grouped[idx] = True
+        members = {}
+        for idx in np.flatnonzero(grouped):
+            group = members.setdefault(labels[idx], set())
+            group.add(doc_ids[idx])
+            group.update(self.exact_duplicates.get(doc_ids[idx], []))
+        duplicate_groups = list(members.values())
+        self.duplicate_groups = duplicate_groups
+        self.duplicate_groups_threshold = similarity_threshold
                 
         print(f"Found {len(duplicate_groups)} groups of potential duplicates")
         return duplicate_groups
     
+    def get_duplicate_groups(self, similarity_threshold: Optional[float] = None) -> List[Set[str]]:
+        """
+        Return the duplicate groups already found at this threshold, computing them only if needed.
+        Without a threshold, groups that exist are reused at the threshold they were built
+        with; otherwise SIMILARITY_THRESHOLD is used.
+        """
+        if similarity_threshold is None:
+            similarity_threshold = (self.duplicate_groups_threshold if self.duplicate_groups is not None
+                                    else SIMILARITY_THRESHOLD)
+        if self.duplicate_groups is None or self.duplicate_groups_threshold != similarity_threshold:
+            return self.find_duplicate_groups(similarity_threshold)
+        return self.duplicate_groups
+    
+    def save_analysis(self):
+        """
+        Persist the analysis results computed so far (duplicate groups, shared passages,
+        the similarity graph, clusters and the linkage matrix) in the embedding store.
+        A dense similarity matrix is saved as a sparse graph of the pairs at or above
+        the duplicate threshold.
+        """
+        from scipy import sparse
+        store = self.store
+        if self.duplicate_groups is not None:
+            store.save_json(EmbeddingStore.GROUPS_FILE, {
+                'threshold': self.duplicate_groups_threshold,
+                'groups': [sorted(group) for group in self.duplicate_groups],
+            })
+            store.save_jsonl(EmbeddingStore.PASSAGES_FILE, self.shared_passages)
+            if self.similarity_graph is None and self.similarity_matrix is not None:
+                rows, cols, scores = self.similarity_edges(self.duplicate_groups_threshold)
+                n_docs = len(self.doc_ids)
+                upper = sparse.coo_matrix((scores, (rows, cols)), shape=(n_docs, n_docs))
+                graph = (upper + upper.T).tocsr()
+            else:
+                graph = self.similarity_graph
+            if graph is not None:
+                sparse.save_npz(store.artifact_path(EmbeddingStore.GRAPH_FILE), graph)
+        if self.document_clusters is not None:
+            store.save_json(EmbeddingStore.CLUSTERS_FILE, {
+                'clusters': self.document_clusters,
+                'stats': self.cluster_stats,
+            })
+            linkage_path = store.artifact_path(EmbeddingStore.LINKAGE_FILE)
+            if self.linkage_matrix is not None:
+                np.save(linkage_path, self.linkage_matrix)
+            elif os.path.exists(linkage_path):
+                # A non-hierarchical backend replaced the clusters the old tree belonged to
+                os.remove(linkage_path)
+    
+    def load_analysis(self):
+        """Restore whatever save_analysis has written; stages that never ran are left empty."""
+        from scipy import sparse
+        store = self.store
+        groups = store.load_json(EmbeddingStore.GROUPS_FILE)
+        if groups is not None:
+            self.duplicate_groups = [set(group) for group in groups['groups']]
+            self.duplicate_groups_threshold = groups['threshold']
+            self.shared_passages = store.load_jsonl(EmbeddingStore.PASSAGES_FILE) or []
+        if os.path.exists(store.artifact_path(EmbeddingStore.GRAPH_FILE)):
+            self.similarity_graph = sparse.load_npz(store.artifact_path(EmbeddingStore.GRAPH_FILE))
+        clusters = store.load_json(EmbeddingStore.CLUSTERS_FILE)
+        if clusters is not None:
+            self.document_clusters = clusters['clusters']
+            self.cluster_stats = clusters['stats']
+            if os.path.exists(store.artifact_path(EmbeddingStore.LINKAGE_FILE)):
+                self.linkage_matrix = np.load(store.artifact_path(EmbeddingStore.LINKAGE_FILE))
+    
     def visualize_similarity_heatmap(self, max_docs: int = 100, 
-                                   output_file: str = "similarity_heatmap.png"):
+                                   output_file: str = "similarity_heatmap.png",
+                                   mode: str = 'sample', n_tiles: int = HEATMAP_TILES,
+                                   statistic: str = 'mean'):
         """
         Visualize the similarity matrix as a heatmap.
-        Limits to max_docs to avoid creating huge visualizations.
+        mode="sample" shows the first max_docs documents to avoid creating huge
+        visualizations; with a sparse similarity graph, pairs below the threshold are
+        shown as 0. mode="aggregate" shows the whole corpus: documents are ordered by
+        dendrogram leaves or cluster and similarity is reduced to n_tiles x n_tiles tiles
+        (see aggregate_similarity_tiles).
         """
-        if self.similarity_matrix is None:
-            self.compute_similarity_matrix()
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+        from matplotlib.colors import LinearSegmentedColormap
+        from scipy import sparse
+        colors = [(1, 1, 1), (0, 0, 1)]  # White to blue
+        cmap = LinearSegmentedColormap.from_list('custom_cmap', colors, N=100)
+        
+        if mode == 'aggregate':
+            tiles = self.aggregate_similarity_tiles(n_tiles, statistic)
+            plt.figure(figsize=(12, 10))
+            sns.heatmap(tiles, xticklabels=False, yticklabels=False, cmap=cmap, vmin=0, vmax=1)
+            plt.title(f'Document Similarity Overview ({len(self.doc_ids)} documents, '
+                      f'{len(tiles)}x{len(tiles)} tiles, {statistic})')
+            plt.tight_layout()
+            plt.savefig(output_file, dpi=300)
+            plt.close()
+            print(f"Saved similarity overview heatmap to {output_file}")
+            return
+        if mode != 'sample':
+            raise ValueError(f"Unknown heatmap mode: {mode}")
+        
+        self._ensure_similarity()
             
-        doc_ids = list(self.document_embeddings.keys())
+        doc_ids = self.doc_ids
+        similarity = self.similarity_graph if self.similarity_graph is not None else self.similarity_matrix
         
         # Limit to a reasonable number of documents for visualization
         if len(doc_ids) > max_docs:
             print(f"Limiting heatmap to first {max_docs} documents")
             doc_ids = doc_ids[:max_docs]
-            similarity_subset = self.similarity_matrix[:max_docs, :max_docs]
+            similarity_subset = similarity[:max_docs, :max_docs]
         else:
-            similarity_subset = self.similarity_matrix
+            similarity_subset = similarity
+        if sparse.issparse(similarity_subset):
+            similarity_subset = similarity_subset.toarray()
         
         # Create short labels for documents
         short_labels = [os.path.basename(doc_id) if isinstance(doc_id, str) else f"Doc {doc_id}" 
                       for doc_id in doc_ids]
         
-        # Create custom colormap - from white to blue
-        colors = [(1, 1, 1), (0, 0, 1)]  # White to blue
-        cmap = LinearSegmentedColormap.from_list('custom_cmap', colors, N=100)
-        
         plt.figure(figsize=(12, 10))
         sns.heatmap(similarity_subset, xticklabels=short_labels, yticklabels=short_labels, 
                    cmap=cmap, vmin=0, vmax=1)
@@ -249,17 +1973,133 @@ class DuplicateDetector:
         plt.close()
         print(f"Saved similarity heatmap to {output_file}")
         
+    def _heatmap_order(self) -> np.ndarray:
+        """Document order for overview plots: dendrogram leaves, else cluster label, else as stored."""
+        from scipy.cluster.hierarchy import leaves_list
+        n_docs = len(self.doc_ids)
+        if self.linkage_matrix is not None and len(self.linkage_matrix) == n_docs - 1:
+            return leaves_list(self.linkage_matrix)
+        if self.document_clusters:
+            labels = np.array([self.document_clusters[doc_id] for doc_id in self.doc_ids])
+            return np.argsort(labels, kind='stable')
+        return np.arange(n_docs)
+    
+    def aggregate_similarity_tiles(self, n_tiles: int = HEATMAP_TILES, statistic: str = 'mean',
+                                   block_size: int = SIMILARITY_BLOCK_SIZE) -> np.ndarray:
+        """
+        Reduce the ordered document-by-document similarity to an n_tiles x n_tiles grid of
+        tile means or maxima, in memory bounded by the grid and one block.
+        The sparse similarity graph is aggregated edge by edge when present (pairs below
+        the threshold count as 0); otherwise similarity is streamed block by block from
+        the dense matrix or, failing that, from the normalized embeddings.
+        """
+        if statistic not in ('mean', 'max'):
+            raise ValueError(f"Unknown tile statistic: {statistic}")
+        n_docs = len(self.doc_ids)
+        n_tiles = max(1, min(n_tiles, n_docs))
+        order = self._heatmap_order()
+        # Tile of each ordered position, and of each document
+        tile_of_position = np.arange(n_docs) * n_tiles // n_docs
+        tile_of_doc = np.empty(n_docs, dtype=np.int64)
+        tile_of_doc[order] = tile_of_position
+        tile_sizes = np.bincount(tile_of_position, minlength=n_tiles)
+        
+        grid = np.zeros((n_tiles, n_tiles), dtype=np.float64)
+        if self.similarity_graph is not None:
+            edges = self.similarity_graph.tocoo()
+            row_tiles, col_tiles = tile_of_doc[edges.row], tile_of_doc[edges.col]
+            if statistic == 'mean':
+                np.add.at(grid, (row_tiles, col_tiles), edges.data)
+            else:
+                np.maximum.at(grid, (row_tiles, col_tiles), edges.data)
+        else:
+            if self.similarity_matrix is None:
+                norms = self._row_norms(block_size)
+            
+            def ordered_rows(start):
+                rows = order[start:start + block_size]
+                block = np.asarray(self.embedding_matrix[np.sort(rows)], dtype=np.float32)
+                # Fancy indexing on a memmap wants sorted rows; restore the plot order after
+                block = block[np.argsort(np.argsort(rows))]
+                return block / norms[rows, None]
+            
+            reduce = np.add.reduceat if statistic == 'mean' else np.maximum.reduceat
+            combine = np.add.at if statistic == 'mean' else np.maximum.at
+            starts = range(0, n_docs, block_size)
+            for i in tqdm(starts):
+                row_block = ordered_rows(i) if self.similarity_matrix is None else None
+                row_tiles = tile_of_position[i:i + block_size]
+                row_cuts = np.flatnonzero(np.r_[True, row_tiles[1:] != row_tiles[:-1]])
+                for j in starts:
+                    if self.similarity_matrix is not None:
+                        block = self.similarity_matrix[np.ix_(order[i:i + block_size], order[j:j + block_size])]
+                    else:
+                        block = row_block @ (row_block if j == i else ordered_rows(j)).T
+                        if i == j:
+                            # Match the dense matrix, which ignores self-similarity
+                            np.fill_diagonal(block, 0)
+                    col_tiles = tile_of_position[j:j + block_size]
+                    col_cuts = np.flatnonzero(np.r_[True, col_tiles[1:] != col_tiles[:-1]])
+                    reduced = reduce(reduce(block, row_cuts, axis=0), col_cuts, axis=1)
+                    combine(grid, np.ix_(row_tiles[row_cuts], col_tiles[col_cuts]), reduced)
+        
+        if statistic == 'mean':
+            grid /= np.outer(tile_sizes, tile_sizes)
+        return grid
+    
+    def project_embeddings_2d(self, refit: bool = False,
+                              max_fit_size: int = UMAP_MAX_FIT_SIZE) -> np.ndarray:
+        """
+        Project document embeddings to 2-D with UMAP, reusing the projection saved in
+        the embedding store. Rows are keyed by doc id and a checksum of their vector:
+        if every row is already known the saved coordinates are returned as is; new or
+        changed rows are projected with the saved reducer's transform. A fresh fit
+        (first run or refit=True) uses a random sample of max_fit_size documents when
+        the corpus is larger and transforms the rest.
+        """
+        import umap
+        keys = [f"{doc_id}:{zlib.crc32(np.asarray(row, dtype=np.float32).tobytes()):08x}"
+                for doc_id, row in zip(self.doc_ids, self.embedding_matrix)]
+        
+        reducer, cached_keys, cached_coords = (None, [], None) if refit else self.store.load_projection()
+        if reducer is not None:
+            position = {key: i for i, key in enumerate(cached_keys)}
+            known = np.array([key in position for key in keys], dtype=bool)
+            coords = np.empty((len(keys), 2), dtype=np.float32)
+            if known.any():
+                coords[known] = cached_coords[[position[key] for key in np.asarray(keys)[known]]]
+            if known.all():
+                print("Reusing cached UMAP projection")
+                return coords
+            
+            new_rows = np.flatnonzero(~known)
+            print(f"Projecting {len(new_rows)} new documents with the cached UMAP reducer")
+            coords[new_rows] = reducer.transform(self.embedding_rows(new_rows))
+        else:
+            reducer = umap.UMAP(n_neighbors=15, min_dist=0.1, n_components=2, random_state=42)
+            if len(keys) > max_fit_size:
+                print(f"Fitting UMAP on a sample of {max_fit_size} of {len(keys)} documents")
+                sample = np.sort(np.random.default_rng(42).choice(len(keys), max_fit_size, replace=False))
+                rest = np.setdiff1d(np.arange(len(keys)), sample)
+                coords = np.empty((len(keys), 2), dtype=np.float32)
+                coords[sample] = reducer.fit_transform(self.embedding_rows(sample))
+                coords[rest] = reducer.transform(self.embedding_rows(rest))
+            else:
+                coords = reducer.fit_transform(self.embedding_rows()).astype(np.float32)
+        
+        self.store.save_projection(reducer, keys, coords)
+        return coords
+    
     def visualize_document_clusters(self, output_file: str = "document_clusters.png"):
         """Visualize document clusters using UMAP for dimensionality reduction."""
+        import matplotlib.pyplot as plt
         if not self.document_clusters:
             self.perform_hierarchical_clustering()
             
-        doc_ids = list(self.document_embeddings.keys())
-        embeddings = np.array(list(self.document_embeddings.values()))
+        doc_ids = self.doc_ids
         
-        # Use UMAP for dimensionality reduction to 2D
-        reducer = umap.UMAP(n_neighbors=15, min_dist=0.1, n_components=2, random_state=42)
-        embedding_2d = reducer.fit_transform(embeddings)
+        # Use UMAP for dimensionality reduction to 2D (cached in the embedding store)
+        embedding_2d = self.project_embeddings_2d()
         
         # Get cluster labels
         labels = [self.document_clusters[doc_id] for doc_id in doc_ids]
@@ -291,42 +2131,67 @@ class DuplicateDetector:
         print(f"Saved cluster visualization to {output_file}")
         
     def visualize_duplicate_network(self, similarity_threshold: float = SIMILARITY_THRESHOLD, 
-                                  output_file: str = "duplicate_network.png"):
-        """Visualize duplicate documents as a network graph."""
-        if self.similarity_matrix is None:
-            self.compute_similarity_matrix()
-            
-        doc_ids = list(self.document_embeddings.keys())
+                                  output_file: str = "duplicate_network.png",
+                                  export_format: Optional[str] = None,
+                                  export_file: Optional[str] = None):
+        """
+        Visualize duplicate documents as a network graph.
+        Edges come from one vectorized pass over the thresholded similarities, and each
+        connected component is laid out on its own. export_format="graphml" writes the
+        graph, "parquet" or "csv" write the edge list straight from the similarity edges;
+        graphs larger than NETWORK_MAX_RENDER_NODES are exported only, and the networkx
+        graph is only built for GraphML or drawing.
+        """
+        if export_format not in (None, 'graphml', 'parquet', 'csv'):
+            raise ValueError(f"Unknown export format: {export_format}")
+        doc_ids = np.asarray(self.doc_ids, dtype=object)
+        rows, cols, scores = self.similarity_edges(similarity_threshold)
         
-        # Create a graph
-        G = nx.Graph()
+        if len(rows) == 0:
+            print("No connections found above threshold. Try lowering the similarity threshold.")
+            return
         
-        # Add nodes
-        for doc_id in doc_ids:
-            short_name = os.path.basename(doc_id) if isinstance(doc_id, str) else f"Doc {doc_id}"
-            G.add_node(doc_id, label=short_name)
+        if export_format in ('parquet', 'csv'):
+            import pandas as pd
+            export_file = export_file or f"duplicate_edges.{export_format}"
+            edges_df = pd.DataFrame({'Document A': doc_ids[rows], 'Document B': doc_ids[cols],
+                                     'Similarity': scores})
+            if export_format == 'parquet':
+                edges_df.to_parquet(export_file, index=False)
+            else:
+                edges_df.to_csv(export_file, index=False)
+            print(f"Exported {len(edges_df)} edges to {export_file}")
         
-        # Add edges for similar documents
-        for i in range(len(doc_ids)):
-            for j in range(i+1, len(doc_ids)):
-                similarity = self.similarity_matrix[i, j]
-                if similarity >= similarity_threshold:
-                    G.add_edge(doc_ids[i], doc_ids[j], weight=similarity)
+        # Only connected documents are nodes; isolated documents never enter the graph
+        n_nodes = len(np.union1d(rows, cols))
+        print(f"Network has {n_nodes} nodes and {len(rows)} edges")
+        render = n_nodes <= NETWORK_MAX_RENDER_NODES
+        if not render:
+            print(f"Network exceeds {NETWORK_MAX_RENDER_NODES} nodes; skipping rendering. Use export_format instead.")
+            if export_format != 'graphml':
+                return
         
-        # Remove isolated nodes (no connections)
-        G.remove_nodes_from(list(nx.isolates(G)))
+        import networkx as nx
+        G = nx.Graph()
+        G.add_weighted_edges_from(zip(doc_ids[rows], doc_ids[cols], scores.astype(float)))
+        nx.set_node_attributes(G, {doc_id: os.path.basename(doc_id) if isinstance(doc_id, str) else f"Doc {doc_id}"
+                                   for doc_id in G.nodes}, 'label')
         
-        if len(G.nodes) == 0:
-            print("No connections found above threshold. Try lowering the similarity threshold.")
+        if export_format == 'graphml':
+            export_file = export_file or "duplicate_network.graphml"
+            nx.write_graphml(G, export_file)
+            print(f"Exported network to {export_file}")
+        
+        if not render:
             return
-            
-        print(f"Network has {len(G.nodes)} nodes and {len(G.edges)} edges")
+        
+        import matplotlib.pyplot as plt
         
         # Set up visualization parameters
         plt.figure(figsize=(15, 15))
         
-        # Use force-directed layout
-        pos = nx.spring_layout(G, k=0.2, iterations=50, seed=42)
+        # Lay out each component separately and tile them, instead of one global spring layout
+        pos = self._component_layout(G)
         
         # Get edge weights for width and color
         edge_weights = [G[u][v]['weight'] for u, v in G.edges()]
@@ -348,22 +2213,60 @@ class DuplicateDetector:
         plt.close()
         print(f"Saved network visualization to {output_file}")
         
-    def save_results_to_excel(self, output_file: str = "duplicate_analysis.xlsx"):
-        """Save the analysis results to an Excel file."""
+    @staticmethod
+    def _component_layout(G, iterations: int = 50) -> Dict[str, np.ndarray]:
+        """
+        Position nodes component by component: each connected component gets its own
+        force-directed layout, scaled by its size and placed on a grid, largest first.
+        Pairs and singletons skip the spring layout entirely.
+        """
+        import networkx as nx
+        components = sorted(nx.connected_components(G), key=len, reverse=True)
+        columns = max(1, int(np.ceil(np.sqrt(len(components)))))
+        pos = {}
+        for number, component in enumerate(components):
+            nodes = sorted(component)
+            if len(nodes) <= 2:
+                local = {node: np.array([offset - 0.5 * (len(nodes) - 1), 0.0]) * 0.5
+                         for offset, node in enumerate(nodes)}
+            else:
+                local = nx.spring_layout(G.subgraph(nodes), iterations=iterations, seed=42)
+            # Bigger components get proportionally more room inside their grid cell
+            scale = 0.45 * min(1.0, np.sqrt(len(nodes) / len(components[0])) + 0.2)
+            origin = np.array([number % columns, -(number // columns)], dtype=float)
+            for node, xy in local.items():
+                pos[node] = origin + scale * np.asarray(xy)
+        return pos
+    
+    def save_results_to_excel(self, output_file: str = "duplicate_analysis.xlsx",
+                              similarity_threshold: Optional[float] = None):
+        """
+        Save the analysis results to an Excel file.
+        Meant as a view of small results; use export_results() for large runs, which
+        writes the same tables as Parquet/CSV without Excel's row limit. The threshold
+        defaults to the one the duplicate groups were built with.
+        """
+        import pandas as pd
         # Prepare data for document clusters
         if self.document_clusters:
+            total_documents = len(self.doc_ids) + sum(len(m) for m in self.exact_duplicates.values())
+            if total_documents > EXCEL_MAX_ROWS:
+                print(f"{total_documents} documents exceed Excel's row limit; use export_results() instead.")
+                return
             cluster_data = []
-            for doc_id, cluster in self.document_clusters.items():
-                short_name = os.path.basename(doc_id) if isinstance(doc_id, str) else f"Doc {doc_id}"
-                cluster_data.append({
-                    'Document ID': doc_id,
-                    'Document Name': short_name,
-                    'Cluster': cluster
-                })
+            for representative, cluster in self.document_clusters.items():
+                # Exact duplicates collapsed by the prefilter share their representative's cluster
+                for doc_id in [representative, *self.exact_duplicates.get(representative, [])]:
+                    short_name = os.path.basename(doc_id) if isinstance(doc_id, str) else f"Doc {doc_id}"
+                    cluster_data.append({
+                        'Document ID': doc_id,
+                        'Document Name': short_name,
+                        'Cluster': cluster
+                    })
             cluster_df = pd.DataFrame(cluster_data)
             
-            # Identify duplicate groups
-            duplicate_groups = self.find_duplicate_groups()
+            # Reuse duplicate groups if they were already computed
+            duplicate_groups = self.get_duplicate_groups(similarity_threshold)
             duplicate_data = []
             
             for i, group in enumerate(duplicate_groups):
@@ -383,24 +2286,8 @@ class DuplicateDetector:
                 duplicate_df.to_excel(writer, sheet_name='Duplicate Groups', index=False)
                 
                 # Add a summary sheet
-                summary_data = {
-                    'Metric': [
-                        'Total Documents',
-                        'Documents with Duplicates',
-                        'Duplicate Groups',
-                        'Total Clusters',
-                        'Largest Cluster Size',
-                        'Similarity Threshold'
-                    ],
-                    'Value': [
-                        len(self.documents),
-                        len(set(duplicate_df['Document ID'])) if not duplicate_df.empty else 0,
-                        duplicate_df['Duplicate Group'].nunique() if not duplicate_df.empty else 0,
-                        cluster_df['Cluster'].nunique() if not cluster_df.empty else 0,
-                        cluster_df.groupby('Cluster').size().max() if not cluster_df.empty else 0,
-                        SIMILARITY_THRESHOLD
-                    ]
-                }
+                summary = self._summary_metrics(duplicate_groups)
+                summary_data = {'Metric': list(summary.keys()), 'Value': list(summary.values())}
                 summary_df = pd.DataFrame(summary_data)
                 summary_df.to_excel(writer, sheet_name='Summary', index=False)
                 
@@ -408,51 +2295,357 @@ class DuplicateDetector:
         else:
             print("No clustering results available. Run perform_hierarchical_clustering() first.")
 
-    def analyze_duplicate_content(self):
-        """Analyze what content is being duplicated across documents."""
-        duplicate_groups = self.find_duplicate_groups()
+    def _summary_metrics(self, duplicate_groups: List[Set[str]]) -> Dict[str, object]:
+        """Summary figures shared by the Excel report and export_results."""
+        collapsed = sum(len(m) for m in self.exact_duplicates.values())
+        if self.document_clusters:
+            # Collapsed exact duplicates count towards their representative's cluster
+            labels = np.fromiter(self.document_clusters.values(), dtype=np.int64, count=len(self.document_clusters))
+            weights = np.array([1 + len(self.exact_duplicates.get(doc_id, [])) for doc_id in self.document_clusters])
+            _, inverse = np.unique(labels, return_inverse=True)
+            cluster_sizes = np.bincount(inverse, weights=weights)
+        else:
+            cluster_sizes = np.empty(0)
+        return {
+            'Total Documents': len(self.doc_ids) + collapsed,
+            'Exact Duplicates Collapsed': collapsed,
+            'Lexical Near-Duplicate Pairs': len(self.near_duplicate_pairs),
+            'Documents with Duplicates': sum(len(group) for group in duplicate_groups),
+            'Duplicate Groups': len(duplicate_groups),
+            'Total Clusters': len(cluster_sizes),
+            'Largest Cluster Size': int(cluster_sizes.max()) if len(cluster_sizes) else 0,
+            'Similarity Threshold': self.duplicate_groups_threshold if self.duplicate_groups_threshold is not None
+                                    else SIMILARITY_THRESHOLD
+        }
+    
+    def export_results(self, output_dir: str = "duplicate_results", fmt: str = 'parquet',
+                       similarity_threshold: Optional[float] = None,
+                       batch_rows: int = EXPORT_BATCH_ROWS) -> Dict[str, str]:
+        """
+        Write clusters, duplicate groups, scored duplicate pairs, shared passages (if
+        analyzed) and the summary as Parquet or CSV tables, streamed in batches of
+        batch_rows. Reuses duplicate groups that were already computed; the threshold
+        defaults to the one they were built with.
+        Returns a mapping of table name to file path.
+        """
+        import pandas as pd
+        os.makedirs(output_dir, exist_ok=True)
+        paths = {}
+        
+        def table_path(name):
+            paths[name] = os.path.join(output_dir, f"{name}.{fmt}")
+            return paths[name]
+        
+        def short_names(doc_ids):
+            return [os.path.basename(doc_id) if isinstance(doc_id, str) else f"Doc {doc_id}" for doc_id in doc_ids]
+        
+        duplicate_groups = self.get_duplicate_groups(similarity_threshold)
+        similarity_threshold = self.duplicate_groups_threshold
+        
+        if self.document_clusters:
+            with ResultTableWriter(table_path('clusters'), fmt) as writer:
+                batch_ids, batch_labels = [], []
+                for representative, cluster in self.document_clusters.items():
+                    for doc_id in [representative, *self.exact_duplicates.get(representative, [])]:
+                        batch_ids.append(doc_id)
+                        batch_labels.append(cluster)
+                    if len(batch_ids) >= batch_rows:
+                        writer.write({'Document ID': batch_ids, 'Document Name': short_names(batch_ids),
+                                      'Cluster': batch_labels})
+                        batch_ids, batch_labels = [], []
+                writer.write({'Document ID': batch_ids, 'Document Name': short_names(batch_ids),
+                              'Cluster': batch_labels})
+        
+        with ResultTableWriter(table_path('duplicate_groups'), fmt) as writer:
+            batch = {'Document ID': [], 'Duplicate Group': [], 'Group Size': []}
+            for number, group in enumerate(duplicate_groups, start=1):
+                for doc_id in sorted(group):
+                    batch['Document ID'].append(doc_id)
+                    batch['Duplicate Group'].append(number)
+                    batch['Group Size'].append(len(group))
+                if len(batch['Document ID']) >= batch_rows:
+                    batch['Document Name'] = short_names(batch['Document ID'])
+                    writer.write(batch)
+                    batch = {'Document ID': [], 'Duplicate Group': [], 'Group Size': []}
+            batch['Document Name'] = short_names(batch['Document ID'])
+            writer.write(batch)
+        
+        with ResultTableWriter(table_path('duplicate_pairs'), fmt) as writer:
+            doc_ids = np.asarray(self.doc_ids, dtype=object)
+            rows, cols, scores = self.similarity_edges(similarity_threshold)
+            for start in range(0, len(rows), batch_rows):
+                end = start + batch_rows
+                writer.write({'Document A': doc_ids[rows[start:end]], 'Document B': doc_ids[cols[start:end]],
+                              'Similarity': scores[start:end], 'Method': 'embedding'})
+            for start in range(0, len(self.near_duplicate_pairs), batch_rows):
+                pairs = self.near_duplicate_pairs[start:start + batch_rows]
+                writer.write({'Document A': [a for a, _, _ in pairs], 'Document B': [b for _, b, _ in pairs],
+                              'Similarity': [score for _, _, score in pairs], 'Method': 'minhash'})
+            # Exact pairs are gathered across representatives, so each batch is one row group
+            batch_a, batch_b = [], []
+            for representative, members in self.exact_duplicates.items():
+                batch_a.extend([representative] * len(members))
+                batch_b.extend(members)
+                if len(batch_a) >= batch_rows:
+                    writer.write({'Document A': batch_a, 'Document B': batch_b, 'Similarity': 1.0, 'Method': 'exact'})
+                    batch_a, batch_b = [], []
+            if batch_a:
+                writer.write({'Document A': batch_a, 'Document B': batch_b, 'Similarity': 1.0, 'Method': 'exact'})
+            if writer.rows == 0:
+                writer.write({'Document A': [], 'Document B': [], 'Similarity': [], 'Method': []})
+        
+        if self.shared_passages:
+            with ResultTableWriter(table_path('shared_passages'), fmt) as writer:
+                for start in range(0, len(self.shared_passages), batch_rows):
+                    writer.write(pd.DataFrame(self.shared_passages[start:start + batch_rows]).to_dict('list'))
+        
+        summary = self._summary_metrics(duplicate_groups)
+        with ResultTableWriter(table_path('summary'), fmt) as writer:
+            writer.write({'Metric': list(summary.keys()), 'Value': [str(v) for v in summary.values()]})
+        
+        print(f"Exported {len(paths)} result tables to {output_dir}")
+        return paths
+    
+    def _chunk_index_by_source(self) -> Tuple[Dict[str, List[int]], List[Tuple[str, int]], Optional[np.ndarray]]:
+        """
+        Build the chunk -> document inverted index: source -> chunk row numbers.
+        Uses the in-memory chunks when present, otherwise the chunk vectors persisted by
+        run_streaming_embedding(keep_chunk_vectors=True).
+        Returns (rows by source, (source, offset) per chunk, chunk vectors).
+        """
+        if self.chunks and self.chunk_embeddings is not None:
+            chunk_refs = [(c.metadata.get('source'), c.metadata.get('start_index', -1)) for c in self.chunks]
+            rows_by_source = {source: list(range(start, end)) for source, (start, end) in self.chunk_ranges.items()}
+            return rows_by_source, chunk_refs, self.chunk_embeddings
+        elif os.path.exists(os.path.join(self.store.store_dir, EmbeddingStore.CHUNK_MATRIX_FILE)):
+            chunk_refs, chunk_vectors = self.store.load_chunks()
+        else:
+            return {}, [], None
+        
+        rows_by_source = {}
+        for row, (source, _) in enumerate(chunk_refs):
+            rows_by_source.setdefault(source, []).append(row)
+        return rows_by_source, chunk_refs, chunk_vectors
+    
+    def analyze_duplicate_content(self, passage_threshold: float = PASSAGE_SIMILARITY_THRESHOLD,
+                                  max_printed_groups: int = 5,
+                                  similarity_threshold: Optional[float] = None) -> List[Dict]:
+        """
+        Analyze which passages are shared across documents in every duplicate group.
+        Chunks of different documents in a group whose embeddings reach passage_threshold
+        are reported with both character offsets; the list is kept in self.shared_passages.
+        Details are printed for the first max_printed_groups groups only. Groups are
+        taken at similarity_threshold (see get_duplicate_groups).
+        """
+        import faiss
+        duplicate_groups = self.get_duplicate_groups(similarity_threshold)
         
         if not duplicate_groups:
             print("No duplicate groups found.")
-            return
-            
-        # For each duplicate group, analyze the shared content
-        for i, group in enumerate(duplicate_groups[:5]):  # Limit to first 5 groups
-            print(f"\nAnalyzing duplicate group {i+1} with {len(group)} documents")
-            
-            # Get document paths
-            doc_paths = list(group)
-            doc_names = [os.path.basename(path) if isinstance(path, str) else f"Doc {path}" 
-                       for path in doc_paths]
-            
-            print(f"Documents in this group: {', '.join(doc_names)}")
+            return []
+        
+        rows_by_source, chunk_refs, chunk_vectors = self._chunk_index_by_source()
+        if chunk_vectors is None:
+            print("No chunk vectors available. Run embed_documents() or stream with keep_chunk_vectors=True.")
+            return []
+        chunk_texts = [c.page_content for c in self.chunks] if self.chunks else None
+        
+        # Collapsed exact duplicates have no chunks of their own; look them up via their representative
+        representative_of = {member: rep for rep, members in self.exact_duplicates.items() for member in members}
+        
+        self.shared_passages = []
+        for group_number, group in enumerate(tqdm(duplicate_groups), start=1):
+            doc_paths = sorted(group)
+            identical = [(doc_id, representative_of[doc_id]) for doc_id in doc_paths if doc_id in representative_of]
+            documents = [doc_id for doc_id in doc_paths if doc_id not in representative_of and doc_id in rows_by_source]
             
-            # Load the content of these documents
-            doc_contents = []
-            for doc_id in doc_paths:
-                # Find the original document
-                matching_docs = [doc for doc in self.documents 
-                               if doc.metadata.get('source') == doc_id]
-                
-                if matching_docs:
-                    doc_contents.append(matching_docs[0].page_content)
-                else:
-                    print(f"Warning: Content not found for document {doc_id}")
+            group_passages = []
+            # Compare each document's chunks with the chunks of the documents after it
+            for pos, doc_a in enumerate(documents[:-1]):
+                rows_a = rows_by_source[doc_a]
+                rows_b = [row for doc_b in documents[pos + 1:] for row in rows_by_source[doc_b]]
+                vectors_a = np.array(chunk_vectors[rows_a], dtype=np.float32)
+                vectors_b = np.array(chunk_vectors[rows_b], dtype=np.float32)
+                faiss.normalize_L2(vectors_a)
+                faiss.normalize_L2(vectors_b)
+                scores = vectors_a @ vectors_b.T
+                for i, j in zip(*np.nonzero(scores >= passage_threshold)):
+                    row_a, row_b = rows_a[i], rows_b[j]
+                    passage = {
+                        'Duplicate Group': group_number,
+                        'Document A': doc_a,
+                        'Offset A': chunk_refs[row_a][1],
+                        'Document B': chunk_refs[row_b][0],
+                        'Offset B': chunk_refs[row_b][1],
+                        'Similarity': float(scores[i, j]),
+                    }
+                    if chunk_texts is not None:
+                        passage['Length A'] = len(chunk_texts[row_a])
+                        passage['Excerpt'] = chunk_texts[row_a][:120]
+                    group_passages.append(passage)
+            self.shared_passages.extend(group_passages)
             
-            if len(doc_contents) < 2:
-                continue
-                
-            # Simple analysis of common text
-            # In a real implementation, you might want more sophisticated text analysis
-            print("Common content analysis would go here")
-            # This would require more sophisticated analysis like extracting key phrases,
-            # finding common procedural steps, etc.
+            if group_number <= max_printed_groups:
+                doc_names = [os.path.basename(path) if isinstance(path, str) else f"Doc {path}" 
+                             for path in doc_paths]
+                print(f"\nAnalyzing duplicate group {group_number} with {len(group)} documents")
+                print(f"Documents in this group: {', '.join(doc_names)}")
+                for doc_id, representative in identical:
+                    print(f"  {os.path.basename(doc_id)} is identical to {os.path.basename(representative)}")
+                print(f"  {len(group_passages)} shared passages")
+                for passage in sorted(group_passages, key=lambda p: -p['Similarity'])[:3]:
+                    print(f"  {os.path.basename(passage['Document A'])}@{passage['Offset A']} ~ "
+                          f"{os.path.basename(passage['Document B'])}@{passage['Offset B']} "
+                          f"({passage['Similarity']:.3f})")
+        
+        print(f"\nFound {len(self.shared_passages)} shared passages across {len(duplicate_groups)} groups")
+        return self.shared_passages
 
-def main():
-    detector = DuplicateDetector(DOCUMENT_DIR)
+class DuplicateQueryService:
+    """
+    Answers "does this document duplicate anything we already have?" against a
+    persisted embedding store. The indexes and the model are loaded once, so each
+    query costs one embedding pass over the new document plus two index searches.
+    Backend and model default to the ones recorded in the store, and a model that
+    differs from the one the store was embedded with is rejected.
+    """
+    def __init__(self, store_dir: str = EMBEDDING_STORE_DIR, embedding_model: Optional[str] = None,
+                 embedding_backend: Optional[str] = None):
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        from langchain.vectorstores import FAISS
+        self.store = EmbeddingStore(store_dir)
+        with open(self.store.index_path, encoding='utf-8') as f:
+            self.doc_ids = json.load(f)
+        self.doc_index = self.store.load_doc_index()
+        meta = self.store.store_meta()
+        embedding_model = embedding_model or meta.get('model', EMBEDDING_MODEL)
+        embedding_backend = embedding_backend or meta.get('backend', EMBEDDING_BACKEND)
+        # Queries embed one document at a time, so a worker pool would only add latency
+        self.embedding_model = load_embedding_model(
+            embedding_model, 'huggingface' if embedding_backend == 'cpu_pool' else embedding_backend)
+        self._check_embedding_model(meta)
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            separators=["\n\n", "\n", ".", " ", ""],
+            add_start_index=True
+        )
+        self.chunk_index = None
+        if os.path.isdir(self.store.chunk_faiss_dir):
+            self.chunk_index = FAISS.load_local(self.store.chunk_faiss_dir, self.embedding_model,
+                                                normalize_L2=True, allow_dangerous_deserialization=True)
+        # Serialize model calls; the HTTP server handles requests on several threads
+        self._lock = threading.Lock()
+        print(f"Query service ready over {len(self.doc_ids)} documents")
+    
+    def _check_embedding_model(self, meta: Dict):
+        """Raise ValueError unless the query model matches the one that embedded the store."""
+        expected = meta.get('embedding_key')
+        if expected is not None and expected != self.embedding_model.cache_key:
+            raise ValueError(f"{self.store.store_dir} was embedded with {expected}, not "
+                             f"{self.embedding_model.cache_key}; query it with the same backend and model")
+        dim = len(self.embedding_model.embed_query("dimension check"))
+        stored_dim = meta.get('dim', self.doc_index.d)
+        if dim != stored_dim:
+            raise ValueError(f"The query model produces {dim}-dimensional vectors, "
+                             f"but {self.store.store_dir} holds {stored_dim}-dimensional ones")
+        if expected is None:
+            print(f"Warning: {self.store.store_dir} does not record its embedding model; "
+                  f"make sure it was embedded with {self.embedding_model.cache_key}")
+        
+    def query(self, text: str, k: int = QUERY_TOP_K) -> Dict:
+        """
+        Return the k nearest existing documents (cosine similarity of mean chunk vectors)
+        and, when the chunk index is available, the best-matching existing passage per
+        query chunk. Raises ValueError for a non-string text or a k below 1.
+        """
+        import faiss
+        from langchain.docstore.document import Document
+        if not isinstance(text, str):
+            raise ValueError("text must be a string")
+        if isinstance(k, bool) or not isinstance(k, (int, np.integer)) or k < 1:
+            raise ValueError("k must be a positive integer")
+        start_time = time.perf_counter()
+        chunks = self.text_splitter.create_documents([text]) or [Document(page_content=text, metadata={})]
+        with self._lock:
+            chunk_vectors = np.asarray(self.embedding_model.embed_documents(
+                [chunk.page_content for chunk in chunks]), dtype=np.float32)
+        
+        doc_vector = chunk_vectors.mean(axis=0, keepdims=True)
+        faiss.normalize_L2(doc_vector)
+        documents = []
+        if self.doc_ids:
+            scores, indices = self.doc_index.search(doc_vector, min(k, len(self.doc_ids)))
+            documents = [{'document': self.doc_ids[i], 'score': float(score)}
+                         for score, i in zip(scores[0], indices[0]) if i >= 0]
+        
+        passages = []
+        if self.chunk_index is not None:
+            for chunk, vector in zip(chunks, chunk_vectors):
+                (match, distance), = self.chunk_index.similarity_search_with_score_by_vector(vector.tolist(), k=1)
+                passages.append({
+                    'query_offset': chunk.metadata.get('start_index', 0),
+                    'document': match.metadata.get('source'),
+                    'document_offset': match.metadata.get('start_index'),
+                    # Squared L2 distance between unit vectors -> cosine similarity
+                    'score': float(1 - distance / 2)
+                })
+        
+        return {
+            'documents': documents,
+            'passages': passages,
+            'elapsed_ms': round((time.perf_counter() - start_time) * 1000, 2)
+        }
+
+def serve_queries(service: DuplicateQueryService, host: str = "127.0.0.1", port: int = QUERY_PORT):
+    """
+    Serve the query API over HTTP.
+    POST /query with JSON {"text": "...", "k": 10} returns the result of service.query;
+    malformed requests get a 400 response.
+    """
+    class QueryHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, payload: Dict):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def do_GET(self):
+            if self.path == '/health':
+                self._send_json(200, {'status': 'ok', 'documents': len(service.doc_ids)})
+            else:
+                self._send_json(404, {'error': 'not found'})
+        
+        def do_POST(self):
+            if self.path != '/query':
+                self._send_json(404, {'error': 'not found'})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                if not isinstance(request, dict):
+                    raise ValueError("request body must be a JSON object")
+                result = service.query(request['text'], request.get('k', QUERY_TOP_K))
+            except (ValueError, KeyError) as e:
+                self._send_json(400, {'error': str(e)})
+                return
+            self._send_json(200, result)
+    
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    print(f"Serving duplicate queries on http://{host}:{port}/query")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+def run_pipeline(document_dir: str = DOCUMENT_DIR, store_dir: str = EMBEDDING_STORE_DIR):
+    """Run every stage in one process, keeping intermediate results in memory."""
+    detector = DuplicateDetector(document_dir, store_dir=store_dir)
     
     # Process the documents
     detector.load_documents()
+    detector.prefilter_documents()
     detector.chunk_documents()
     detector.embed_documents()
     detector.compute_similarity_matrix()
@@ -463,11 +2656,116 @@ def main():
     detector.visualize_document_clusters()
     detector.visualize_duplicate_network()
     
-    # Save results
-    detector.save_results_to_excel()
-    
     # Optional: Analyze what content is being duplicated
     detector.analyze_duplicate_content()
     
+    # Save results; the Excel workbook is a view for results small enough to fit
+    detector.export_results()
+    detector.save_results_to_excel()
+
+def _open_detector(args, with_chunks: bool = False) -> DuplicateDetector:
+    """Detector over the persisted store, with every stage output that exists restored."""
+    detector = DuplicateDetector(args.documents, store_dir=args.store)
+    detector.load_embeddings()
+    if os.path.exists(detector.store.artifact_path(EmbeddingStore.INGEST_FILE)):
+        detector.load_ingest(with_chunks=with_chunks)
+    detector.load_analysis()
+    return detector
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Find duplicate documents using BERT embeddings. Without a subcommand every '
+                    'stage runs in one process; subcommands run one stage against the artifacts '
+                    'persisted in the embedding store by the stages before it.')
+    parser.add_argument('--store', default=EMBEDDING_STORE_DIR, help='Embedding store directory')
+    parser.add_argument('--documents', default=DOCUMENT_DIR, help='Document directory')
+    subcommands = parser.add_subparsers(dest='command')
+    
+    ingest = subcommands.add_parser('ingest', help='Load, prefilter and chunk documents')
+    ingest.add_argument('--workers', type=int, default=N_WORKERS, help='Loader/chunker processes')
+    ingest.add_argument('--no-near-duplicates', action='store_true', help='Skip the MinHash prefilter')
+    
+    embed = subcommands.add_parser('embed', help='Embed the ingested chunks into the store')
+    embed.add_argument('--backend', default=EMBEDDING_BACKEND, choices=['huggingface', 'cpu_pool', 'hashing'])
+    embed.add_argument('--batch-size', type=int, default=EMBEDDING_BATCH_SIZE)
+    embed.add_argument('--no-cache', action='store_true', help='Re-embed every chunk')
+    
+    group = subcommands.add_parser('group', help='Find duplicate groups and shared passages')
+    group.add_argument('--mode', default=SIMILARITY_MODE, choices=['dense', 'ann', 'blocked'])
+    group.add_argument('--threshold', type=float, default=SIMILARITY_THRESHOLD)
+    group.add_argument('--passage-threshold', type=float, default=PASSAGE_SIMILARITY_THRESHOLD)
+    
+    cluster = subcommands.add_parser('cluster', help='Cluster the document embeddings')
+    cluster.add_argument('--backend', default=CLUSTERING_BACKEND, choices=['hierarchical', 'knn_graph', 'birch'])
+    cluster.add_argument('--method', default='ward', help='Linkage method for the hierarchical backend')
+    cluster.add_argument('--distance-threshold', type=float, default=0.5)
+    
+    visualize = subcommands.add_parser('visualize', help='Draw the heatmap, cluster map and duplicate network')
+    visualize.add_argument('--heatmap-mode', default='sample', choices=['sample', 'aggregate'])
+    
+    export = subcommands.add_parser('export', help='Write result tables (and optionally the Excel view)')
+    export.add_argument('--output-dir', default='duplicate_results')
+    export.add_argument('--format', default='parquet', choices=['parquet', 'csv'])
+    export.add_argument('--excel', metavar='FILE', help='Also write the Excel workbook')
+    export.add_argument('--threshold', type=float,
+                        help='Similarity threshold (default: the one the saved duplicate groups were built with)')
+    
+    query = subcommands.add_parser('query', help='Check documents against the store')
+    query.add_argument('file', nargs='?', help='Check one document and exit')
+    query.add_argument('--serve', action='store_true', help='Serve the query API over HTTP')
+    query.add_argument('--host', default='127.0.0.1', help='Host for --serve')
+    query.add_argument('--port', type=int, default=QUERY_PORT, help='Port for --serve')
+    query.add_argument('--top-k', '-k', type=int, default=QUERY_TOP_K, help='Documents returned per query')
+    query.add_argument('--backend', choices=['huggingface', 'cpu_pool', 'hashing'],
+                       help='Backend the store was embedded with (default: the one recorded in the store)')
+    
+    args = parser.parse_args()
+    
+    if args.command is None:
+        run_pipeline(args.documents, args.store)
+    elif args.command == 'ingest':
+        detector = DuplicateDetector(args.documents, store_dir=args.store, n_workers=args.workers)
+        detector.load_documents()
+        detector.prefilter_documents(near_duplicates=not args.no_near_duplicates)
+        detector.chunk_documents()
+        detector.save_ingest()
+    elif args.command == 'embed':
+        detector = DuplicateDetector(args.documents, store_dir=args.store, embedding_backend=args.backend)
+        detector.load_ingest()
+        detector.embed_documents(use_cached=not args.no_cache, batch_size=args.batch_size,
+                                 keep_chunk_vectors=True)
+        detector.embedding_model.close()
+    elif args.command == 'group':
+        detector = _open_detector(args, with_chunks=True)
+        detector.compute_similarity_matrix(mode=args.mode, similarity_threshold=args.threshold)
+        detector.find_duplicate_groups(args.threshold)
+        detector.analyze_duplicate_content(passage_threshold=args.passage_threshold,
+                                           similarity_threshold=args.threshold)
+        detector.save_analysis()
+    elif args.command == 'cluster':
+        detector = _open_detector(args)
+        detector.perform_hierarchical_clustering(method=args.method, distance_threshold=args.distance_threshold,
+                                                 backend=args.backend)
+        detector.save_analysis()
+    elif args.command == 'visualize':
+        detector = _open_detector(args)
+        detector.visualize_similarity_heatmap(mode=args.heatmap_mode)
+        detector.visualize_document_clusters()
+        detector.visualize_duplicate_network()
+    elif args.command == 'export':
+        detector = _open_detector(args)
+        detector.export_results(args.output_dir, fmt=args.format, similarity_threshold=args.threshold)
+        if args.excel:
+            detector.save_results_to_excel(args.excel, similarity_threshold=args.threshold)
+    elif args.command == 'query':
+        if not args.file and not args.serve:
+            parser.error("query needs a FILE or --serve")
+        service = DuplicateQueryService(args.store, embedding_backend=args.backend)
+        if args.serve:
+            serve_queries(service, args.host, args.port)
+        else:
+            with open(args.file, encoding='utf-8', errors='replace') as f:
+                print(json.dumps(service.query(f.read(), args.top_k), indent=2))
+    
 if __name__ == "__main__":
     main()
@@ -0,0 +1,252 @@
+"""
+Stage-level benchmark for the DuplicateDetector pipeline in clustering.py.
+
+Generates synthetic corpora of controlled size and duplicate rate, runs every stage
+with the deterministic HashingBackend (no model download, runs offline) and writes a
+JSON report with wall time and peak memory per stage and size, plus the scaling
+exponent of each stage between consecutive sizes. An untimed warm-up run on a small
+corpus goes first, so lazy imports and other one-time costs do not land in the
+timings of the smallest size.
+
+    python clustering_benchmark.py --sizes 500 2000 8000 --duplicate-rate 0.1
+"""
+import os
+import sys
+import time
+import json
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+from typing import List, Dict, Callable
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+import clustering
+
+BENCHMARK_SIZES = [500, 2000, 8000]  # Documents per synthetic corpus
+BENCHMARK_DUPLICATE_RATE = 0.1  # Fraction of documents that copy an earlier document
+BENCHMARK_EXACT_SHARE = 0.5  # Share of the copies that are byte-identical (the rest are lightly edited)
+BENCHMARK_WORDS_PER_DOC = 400
+BENCHMARK_VOCABULARY = 5000
+BENCHMARK_WARMUP_DOCS = 100  # Untimed run that pays lazy imports before the first measured size
+BENCHMARK_REPORT = "benchmark_report.json"
+
+def make_corpus(out_dir: str, n_docs: int, duplicate_rate: float = BENCHMARK_DUPLICATE_RATE,
+                words_per_doc: int = BENCHMARK_WORDS_PER_DOC, exact_share: float = BENCHMARK_EXACT_SHARE,
+                seed: int = 0) -> Dict[str, int]:
+    """
+    Write n_docs text files to out_dir. Originals are random words from a fixed
+    vocabulary; a duplicate_rate fraction of documents copy a random original, either
+    exactly or with 2% of their words replaced. Returns the planted counts.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array([f"w{i}" for i in range(BENCHMARK_VOCABULARY)])
+    n_copies = int(round(n_docs * duplicate_rate))
+    n_originals = n_docs - n_copies
+
+    originals = [vocabulary[rng.integers(0, len(vocabulary), words_per_doc)] for _ in range(n_originals)]
+    n_exact = 0
+    os.makedirs(out_dir, exist_ok=True)
+    for i in range(n_docs):
+        if i < n_originals:
+            words = originals[i]
+        else:
+            words = originals[rng.integers(0, n_originals)].copy()
+            if rng.random() < exact_share:
+                n_exact += 1
+            else:
+                edited = rng.choice(words_per_doc, max(1, words_per_doc // 50), replace=False)
+                words[edited] = vocabulary[rng.integers(0, len(vocabulary), len(edited))]
+        # Ten words per line, so the splitter sees paragraph-like text
+        lines = [" ".join(words[start:start + 10]) for start in range(0, words_per_doc, 10)]
+        with open(os.path.join(out_dir, f"doc_{i:07d}.txt"), 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines))
+    return {'documents': n_docs, 'originals': n_originals, 'exact_copies': n_exact,
+            'edited_copies': n_copies - n_exact}
+
+def _current_rss_mb() -> float:
+    """Resident set size of this process right now, in MB (read from /proc; NaN elsewhere)."""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return float('nan')
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+def _peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB."""
+    if resource is None:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+def time_stage(name: str, func: Callable, trace_memory: bool = True,
+               verbose: bool = False) -> Dict[str, float]:
+    """
+    Run one stage, returning its wall time, the process RSS before and after it and
+    its peak traced allocation. The RSS high-water mark is not reported per stage: it
+    only ever grows, so every stage after the largest would repeat that stage's peak.
+    """
+    if trace_memory:
+        tracemalloc.reset_peak()
+    rss_before = _current_rss_mb()
+    # Stage output is noise next to the timings unless asked for
+    with open(os.devnull, 'w') as devnull, \
+         (contextlib.nullcontext() if verbose else contextlib.redirect_stdout(devnull)):
+        start_time = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start_time
+    result = {'stage': name, 'seconds': round(seconds, 4), 'rss_before_mb': round(rss_before, 1),
+              'rss_after_mb': round(_current_rss_mb(), 1)}
+    if trace_memory:
+        result['peak_traced_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+    print(f"  {name}: {seconds:.3f}s")
+    return result
+
+def benchmark_size(n_docs: int, work_dir: str, duplicate_rate: float = BENCHMARK_DUPLICATE_RATE,
+                   similarity_mode: str = clustering.SIMILARITY_MODE,
+                   clustering_backend: str = clustering.CLUSTERING_BACKEND,
+                   n_workers: int = clustering.N_WORKERS, trace_memory: bool = True,
+                   verbose: bool = False) -> Dict:
+    """Generate one corpus in work_dir and time every pipeline stage on it."""
+    corpus_dir = os.path.join(work_dir, "corpus")
+    planted = make_corpus(corpus_dir, n_docs, duplicate_rate)
+
+    detector = clustering.DuplicateDetector(corpus_dir, store_dir=os.path.join(work_dir, "store"),
+                                            n_workers=n_workers, embedding_backend='hashing')
+    export_format = 'parquet' if clustering.parquet_available() else 'csv'
+    stages = [
+        ('load_documents', detector.load_documents),
+        ('prefilter_documents', detector.prefilter_documents),
+        ('chunk_documents', detector.chunk_documents),
+        ('embed_documents', lambda: detector.embed_documents(use_cached=False)),
+        ('compute_similarity_matrix', lambda: detector.compute_similarity_matrix(mode=similarity_mode)),
+        ('perform_hierarchical_clustering',
+         lambda: detector.perform_hierarchical_clustering(backend=clustering_backend)),
+        ('find_duplicate_groups', detector.find_duplicate_groups),
+        ('export_results', lambda: detector.export_results(os.path.join(work_dir, "results"), fmt=export_format)),
+        ('save_results_to_excel', lambda: detector.save_results_to_excel(os.path.join(work_dir, "results.xlsx"))),
+    ]
+
+    print(f"Benchmarking {n_docs} documents...")
+    results = [time_stage(name, func, trace_memory, verbose) for name, func in stages]
+
+    detector.embedding_model.close()
+    grouped = sum(len(group) for group in detector.duplicate_groups)
+    return {
+        'corpus': planted,
+        'chunks': len(detector.chunks),
+        'embedded_documents': len(detector.doc_ids),
+        'duplicate_groups': len(detector.duplicate_groups),
+        'documents_in_groups': grouped,
+        'export_format': export_format,
+        'total_seconds': round(sum(stage['seconds'] for stage in results), 4),
+        # High-water mark of the whole process, so it includes the sizes benchmarked before
+        'process_peak_rss_mb': round(_peak_rss_mb(), 1),
+        'stages': results,
+    }
+
+def scaling_exponents(runs: List[Dict]) -> List[Dict]:
+    """
+    Fit t ~ n^k between consecutive sizes for every stage. k near 1 is linear, near 2
+    quadratic; a jump in k between size pairs marks a scaling cliff.
+    """
+    exponents = []
+    for smaller, larger in zip(runs, runs[1:]):
+        n1, n2 = smaller['corpus']['documents'], larger['corpus']['documents']
+        pair = {'from_documents': n1, 'to_documents': n2, 'stages': {}}
+        for s1, s2 in zip(smaller['stages'], larger['stages']):
+            if s1['seconds'] > 0 and s2['seconds'] > 0 and n2 != n1:
+                pair['stages'][s1['stage']] = round(float(np.log(s2['seconds'] / s1['seconds']) / np.log(n2 / n1)), 2)
+        exponents.append(pair)
+    return exponents
+
+def run_benchmark(sizes: List[int] = BENCHMARK_SIZES, duplicate_rate: float = BENCHMARK_DUPLICATE_RATE,
+                  similarity_mode: str = clustering.SIMILARITY_MODE,
+                  clustering_backend: str = clustering.CLUSTERING_BACKEND,
+                  n_workers: int = clustering.N_WORKERS, trace_memory: bool = True,
+                  output_file: str = BENCHMARK_REPORT, verbose: bool = False,
+                  warmup_docs: int = BENCHMARK_WARMUP_DOCS) -> Dict:
+    """
+    Benchmark every size in ascending order and write the JSON report. With
+    warmup_docs, every stage first runs once on a corpus of that size; its results are
+    discarded.
+    """
+    if warmup_docs:
+        print(f"Warming up on {warmup_docs} documents...")
+        with tempfile.TemporaryDirectory(prefix="dedup_bench_") as work_dir, \
+             open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            benchmark_size(warmup_docs, work_dir, duplicate_rate, similarity_mode,
+                           clustering_backend, n_workers, trace_memory=False)
+    if trace_memory:
+        tracemalloc.start()
+    runs = []
+    try:
+        for n_docs in sorted(sizes):
+            with tempfile.TemporaryDirectory(prefix="dedup_bench_") as work_dir:
+                runs.append(benchmark_size(n_docs, work_dir, duplicate_rate, similarity_mode,
+                                           clustering_backend, n_workers, trace_memory, verbose))
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+        },
+        'config': {
+            'sizes': sorted(sizes),
+            'duplicate_rate': duplicate_rate,
+            'similarity_mode': similarity_mode,
+            'clustering_backend': clustering_backend,
+            'n_workers': n_workers,
+            'warmup_docs': warmup_docs,
+            'embedding_backend': 'hashing',
+            'chunk_size': clustering.CHUNK_SIZE,
+            'chunk_overlap': clustering.CHUNK_OVERLAP,
+            # Traced memory covers this process only; pool workers are not included
+            'trace_memory': trace_memory,
+        },
+        'runs': runs,
+        'scaling': scaling_exponents(runs),
+    }
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark report saved to {output_file}")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the duplicate-detection pipeline stage by stage')
+    parser.add_argument('--sizes', type=int, nargs='+', default=BENCHMARK_SIZES, help='Corpus sizes in documents')
+    parser.add_argument('--duplicate-rate', type=float, default=BENCHMARK_DUPLICATE_RATE,
+                        help='Fraction of documents that copy another document')
+    parser.add_argument('--similarity-mode', default=clustering.SIMILARITY_MODE,
+                        choices=['dense', 'ann', 'blocked'])
+    parser.add_argument('--clustering-backend', default=clustering.CLUSTERING_BACKEND,
+                        choices=['hierarchical', 'knn_graph', 'birch'])
+    parser.add_argument('--workers', type=int, default=clustering.N_WORKERS, help='Loader/chunker processes')
+    parser.add_argument('--no-trace-memory', action='store_true',
+                        help='Skip tracemalloc (faster; only RSS is reported)')
+    parser.add_argument('--warmup-docs', type=int, default=BENCHMARK_WARMUP_DOCS,
+                        help='Documents in the untimed warm-up run (0 skips it)')
+    parser.add_argument('--output', default=BENCHMARK_REPORT, help='JSON report path')
+    parser.add_argument('--verbose', action='store_true', help='Show the pipeline output of each stage')
+    args = parser.parse_args()
+
+    run_benchmark(args.sizes, args.duplicate_rate, args.similarity_mode, args.clustering_backend,
+                  args.workers, not args.no_trace_memory, args.output, args.verbose, args.warmup_docs)
+
+if __name__ == "__main__":
+    main()
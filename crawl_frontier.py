@@ -0,0 +1,92 @@
+import heapq
+import itertools
+import threading
+from collections import deque
+from urllib.parse import urldefrag
+
+
+class CrawlFrontier:
+    def __init__(self, priority=None):
+        """
+        Queue of URLs still to crawl, shared by the scrapers.
+
+        Every URL ever enqueued is kept in a seen-set, so membership checks and
+        de-duplication are O(1) and a URL is queued at most once per crawl. Fragments
+        are stripped first (page#a and page#b are the same page). All methods are
+        thread-safe.
+
+        Args:
+            priority: None for first-in first-out (breadth-first) order with O(1)
+                push/pop, "depth" to always pop the shallowest URL next, or a callable
+                score(url, depth) where lower scores are popped first. Prioritized
+                frontiers use a heap, so push/pop are O(log n).
+        """
+        if priority not in (None, "depth") and not callable(priority):
+            raise ValueError(f"Unknown frontier priority: {priority}")
+        self.priority = priority
+        self._queue = deque() if priority is None else []
+        self._seen = set()
+        # Tie-breaker keeping equal-priority URLs in insertion order
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(url):
+        """Canonical form used for de-duplication."""
+        return urldefrag(url)[0]
+
+    def push(self, url, depth, score=None):
+        """
+        Enqueue a URL unless it has been seen before.
+
+        Args:
+            url (str): URL to crawl
+            depth (int): Link depth from the start URL
+            score (float): Explicit priority for this URL (lower pops first),
+                overriding the frontier's priority function
+
+        Returns:
+            bool: True if the URL was added
+        """
+        url = self.normalize(url)
+        with self._lock:
+            if url in self._seen:
+                return False
+            self._seen.add(url)
+            if self.priority is None:
+                self._queue.append((url, depth))
+            else:
+                if score is None:
+                    score = depth if self.priority == "depth" else self.priority(url, depth)
+                heapq.heappush(self._queue, (score, next(self._counter), url, depth))
+            return True
+
+    def extend(self, links):
+        """Enqueue (url, depth) pairs; returns how many were new."""
+        return sum(self.push(url, depth) for url, depth in links)
+
+    def pop(self):
+        """Remove and return the next (url, depth); raises IndexError when empty."""
+        with self._lock:
+            if self.priority is None:
+                return self._queue.popleft()
+            _, _, url, depth = heapq.heappop(self._queue)
+            return url, depth
+
+    def mark_seen(self, url):
+        """Record a URL as seen without queueing it (e.g. one fetched elsewhere)."""
+        with self._lock:
+            self._seen.add(self.normalize(url))
+
+    def __contains__(self, url):
+        """Whether the URL was ever enqueued or marked seen."""
+        with self._lock:
+            return self.normalize(url) in self._seen
+
+    def __len__(self):
+        """Number of URLs waiting to be crawled."""
+        with self._lock:
+            return len(self._queue)
+
+    def __bool__(self):
+        return len(self) > 0
@@ -0,0 +1,113 @@
+import importlib.util
+import threading
+from collections import Counter
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Advertise brotli only when urllib3 can decode it
+ACCEPT_ENCODING = "gzip, deflate" + (", br" if importlib.util.find_spec("brotli") or
+                                     importlib.util.find_spec("brotlicffi") else "")
+
+
+class _CountingAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools report every new (non-reused) connection."""
+
+    def __init__(self, on_new_connection, **kwargs):
+        self._on_new_connection = on_new_connection
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        on_new_connection = self._on_new_connection
+
+        def counting(pool_cls):
+            class CountingPool(pool_cls):
+                def _new_conn(self):
+                    on_new_connection(self.host)
+                    return super()._new_conn()
+            return CountingPool
+
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: counting(pool_cls) for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+
+class PooledSession:
+    def __init__(self, pool_maxsize=10, pool_connections=10, headers=None, timeout=10, max_retries=0):
+        """
+        Keep-alive HTTP session shared by a scraper's worker threads.
+
+        One requests.Session is shared so every thread draws from the same
+        per-host connection pools; the urllib3 pools are thread-safe and block
+        when all pool_maxsize connections to a host are busy instead of opening
+        throwaway ones. Responses are requested compressed. New connections
+        (each one a TCP and, for https, a TLS handshake) are counted against
+        requests, so stats() shows how often connections were reused.
+
+        Args:
+            pool_maxsize (int): Connections kept open per host; match the number
+                of worker threads
+            pool_connections (int): Number of hosts whose pools are cached
+            headers (dict): Headers sent with every request
+            timeout (float): Default request timeout in seconds
+            max_retries (int): Connection-level retries passed to the adapter
+        """
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._requests = Counter()
+        self._connections = Counter()
+
+        self.session = requests.Session()
+        self.session.headers.update({'Accept-Encoding': ACCEPT_ENCODING, 'Connection': 'keep-alive'})
+        self.session.headers.update(headers or {})
+        adapter = _CountingAdapter(self._record_connection, pool_connections=pool_connections,
+                                   pool_maxsize=pool_maxsize, pool_block=True, max_retries=max_retries)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.hooks['response'].append(self._record_response)
+
+    def _record_connection(self, host):
+        with self._lock:
+            self._connections[host] += 1
+
+    def _record_response(self, response, *args, **kwargs):
+        with self._lock:
+            self._requests[urlparse(response.url).netloc.split(':')[0]] += 1
+
+    def get(self, url, **kwargs):
+        """GET through the shared pools; takes the same arguments as requests.get."""
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def stats(self):
+        """Requests, new connections and connection reuse ratio, overall and per host."""
+        with self._lock:
+            hosts = {
+                host: {'requests': self._requests[host], 'connections': self._connections[host]}
+                for host in set(self._requests) | set(self._connections)
+            }
+        total_requests = sum(h['requests'] for h in hosts.values())
+        total_connections = sum(h['connections'] for h in hosts.values())
+        return {
+            'requests': total_requests,
+            'connections': total_connections,
+            'reused': max(total_requests - total_connections, 0),
+            'reuse_ratio': 1 - total_connections / total_requests if total_requests else 0.0,
+            'hosts': hosts,
+        }
+
+    def format_stats(self):
+        stats = self.stats()
+        return (f"{stats['requests']} requests over {stats['connections']} connections "
+                f"({stats['reuse_ratio']:.1%} reused)")
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -8,9 +8,12 @@ from bs4 import BeautifulSoup
 import requests
 from weasyprint import HTML, CSS
 from weasyprint.text.fonts import FontConfiguration
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
 import re
 import random
+from crawl_frontier import CrawlFrontier
+from http_session import PooledSession
 
 # Set up logging
 logging.basicConfig(
@@ -24,7 +27,8 @@ logging.basicConfig(
 
 class URLToPDFScraper:
     def __init__(self, start_url, output_folder="downloaded_pdfs", max_pages=100, delay=1, 
-                 max_depth=5, same_domain_only=True, exclude_patterns=None):
+                 max_depth=5, same_domain_only=True, exclude_patterns=None, max_workers=5,
+                 priority=None, session=None):
         """
         Initialize the URL to PDF scraper.
         
@@ -32,10 +36,15 @@ class URLToPDFScraper:
             start_url (str): The starting URL to begin scraping from
             output_folder (str): Directory to save PDFs
             max_pages (int): Maximum number of pages to scrape
-            delay (float): Delay between requests to avoid overloading servers
+            delay (float): Minimum delay between requests to the same host
             max_depth (int): Maximum depth to follow links
             same_domain_only (bool): Only follow links within the same domain
             exclude_patterns (list): URL patterns to exclude
+            max_workers (int): Number of pages fetched and rendered concurrently
+            priority: Frontier order: None (breadth-first), "depth" or a
+                score(url, depth) callable, lower first (see CrawlFrontier)
+            session (PooledSession): Keep-alive session to fetch with; by default one
+                with a per-host pool of max_workers connections
         """
         self.start_url = start_url
         self.output_folder = output_folder
@@ -43,6 +52,11 @@ class URLToPDFScraper:
         self.delay = delay
         self.max_depth = max_depth
         self.same_domain_only = same_domain_only
+        self.max_workers = max_workers
+        self.headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        }
+        self.session = session or PooledSession(pool_maxsize=max_workers, headers=self.headers)
         
         # Default exclude patterns if none provided
         self.exclude_patterns = exclude_patterns or [
@@ -53,10 +67,15 @@ class URLToPDFScraper:
         
         # Set up variables to track visited URLs
         self.visited_urls = set()
-        self.urls_to_visit = []
+        self.frontier = CrawlFrontier(priority)
         self.url_metadata = []
         self.domain = urlparse(start_url).netloc
         
+        # Workers share visited_urls and url_metadata; politeness is tracked per host
+        self._lock = threading.Lock()
+        self._host_lock = threading.Lock()
+        self._host_next_request = {}
+        
         # Ensure output folder exists
         if not os.path.exists(output_folder):
             os.makedirs(output_folder)
@@ -105,32 +124,53 @@ class URLToPDFScraper:
         
         return True
 
+    def wait_for_host(self, url):
+        """
+        Block until this host's politeness delay has passed. Each caller reserves the
+        next free slot for the host, so concurrent workers hitting the same host are
+        spaced `delay` seconds apart while other hosts are not held up.
+        """
+        host = urlparse(url).netloc
+        with self._host_lock:
+            now = time.monotonic()
+            slot = max(now, self._host_next_request.get(host, now))
+            self._host_next_request[host] = slot + self.delay
+        if slot > now:
+            time.sleep(slot - now)
+
+    def claim_url(self, url):
+        """Mark a URL as visited; returns False if another worker already took it."""
+        with self._lock:
+            if url in self.visited_urls:
+                return False
+            self.visited_urls.add(url)
+            return True
+
     def extract_links(self, url, depth):
         """Extract links from a webpage."""
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            response = requests.get(url, headers=headers, timeout=10)
+            response = self.session.get(url, timeout=10)
             response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Extract links
-            links = []
-            for a_tag in soup.find_all('a', href=True):
-                href = a_tag['href']
-                full_url = urljoin(url, href)
-                
-                if self.is_valid_url(full_url):
-                    links.append((full_url, depth + 1))
-            
-            return links, response.text
+            return self.parse_links(url, response.text, depth), response.text
             
         except (requests.RequestException, Exception) as e:
             logging.error(f"Error extracting links from {url}: {str(e)}")
             return [], None
 
+    def parse_links(self, url, html_content, depth):
+        """Extract the links worth following from a page's HTML."""
+        soup = BeautifulSoup(html_content, 'html.parser')
+        
+        links = []
+        for a_tag in soup.find_all('a', href=True):
+            href = a_tag['href']
+            full_url = urljoin(url, href)
+            
+            if self.is_valid_url(full_url):
+                links.append((full_url, depth + 1))
+        
+        return links
+
     def sanitize_filename(self, url):
         """Convert URL to a safe filename."""
         # Extract domain and path
@@ -189,34 +229,42 @@ class URLToPDFScraper:
         """Process a single URL: extract links and save to PDF."""
         url, depth = url_data
         
-        if depth > self.max_depth or url in self.visited_urls:
+        if depth > self.max_depth or not self.claim_url(url):
             return []
         
-        self.visited_urls.add(url)
         logging.info(f"Processing URL: {url} (Depth: {depth})")
         
-        # Extract links and HTML content
+        # Wait our turn for this host, then extract links and HTML content
+        self.wait_for_host(url)
         links, html_content = self.extract_links(url, depth)
         
         if html_content:
-            # Generate a filename for the PDF
-            filename = self.sanitize_filename(url)
-            
-            # Save to PDF
-            pdf_path = self.save_to_pdf(url, html_content, filename)
-            
-            # Add metadata
+            self.save_page(url, depth, html_content)
+        
+        return links
+
+    def save_page(self, url, depth, html_content):
+        """Render a fetched page to PDF and record its metadata."""
+        # Generate a filename for the PDF
+        filename = self.sanitize_filename(url)
+        
+        # Save to PDF
+        pdf_path = self.save_to_pdf(url, html_content, filename)
+        
+        # Add metadata
+        with self._lock:
             self.url_metadata.append({
                 'URL': url,
                 'Filename': filename,
                 'Depth': depth,
                 'File Path': pdf_path
             })
-        
-        # Add a delay to avoid overloading the server
-        time.sleep(self.delay)
-        
-        return links
+
+    def handle_fetched_page(self, url, depth, html_content):
+        """Executor-side work for a page fetched by the async engine: PDF, metadata, links."""
+        logging.info(f"Processing URL: {url} (Depth: {depth})")
+        self.save_page(url, depth, html_content)
+        return self.parse_links(url, html_content, depth)
 
     def crawl(self):
         """Crawl the website and convert pages to PDFs."""
@@ -224,22 +272,64 @@ class URLToPDFScraper:
         logging.info(f"Maximum pages: {self.max_pages}")
         
         # Initialize with the start URL
-        self.urls_to_visit.append((self.start_url, 0))
+        self.frontier.push(self.start_url, 0)
         
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            while self.urls_to_visit and len(self.visited_urls) < self.max_pages:
-                # Get the next URL to process
-                current_url_data = self.urls_to_visit.pop(0)
-                
-                # Process the URL
-                new_links = self.process_url(current_url_data)
+        # Only this thread pops the frontier; workers fetch, render and return new links
+        in_flight = {}
+        submitted = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while self.frontier or in_flight:
+                # Keep up to max_workers pages in flight without exceeding max_pages
+                while self.frontier and len(in_flight) < self.max_workers and submitted < self.max_pages:
+                    url, depth = self.frontier.pop()
+                    if depth > self.max_depth or url in self.visited_urls:
+                        continue
+                    in_flight[executor.submit(self.process_url, (url, depth))] = url
+                    submitted += 1
+                if not in_flight:
+                    break
                 
-                # Add new links to the queue
-                for link in new_links:
-                    if link[0] not in self.visited_urls and link[0] not in [url for url, _ in self.urls_to_visit]:
-                        self.urls_to_visit.append(link)
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del in_flight[future]
+                    try:
+                        new_links = future.result()
+                    except Exception as e:
+                        logging.error(f"Worker failed: {str(e)}")
+                        continue
+                    
+                    # The frontier drops links that were already queued or visited
+                    self.frontier.extend(new_links)
                 
-                logging.info(f"Visited: {len(self.visited_urls)} | Queue: {len(self.urls_to_visit)}")
+                logging.info(f"Visited: {len(self.visited_urls)} | In flight: {len(in_flight)} | "
+                             f"Queue: {len(self.frontier)}")
+        
+        # Save metadata to Excel
+        self.save_metadata()
+        
+        logging.info(f"Crawl complete. Processed {len(self.visited_urls)} pages.")
+        logging.info(f"Connections: {self.session.format_stats()}")
+        return self.url_metadata
+
+    def crawl_async(self, per_host_concurrency=4, timeout=10, max_retries=3):
+        """
+        Crawl with the asyncio fetch engine (async_fetch.AsyncFetcher, needs aiohttp).
+        max_workers is the number of requests in flight, which can be in the hundreds
+        since waiting on a slow page costs no thread. The delay becomes a per-host
+        token-bucket rate of 1/delay requests per second, 429/5xx responses are retried
+        with backoff, and parsing and PDF rendering run in a thread pool.
+        """
+        from async_fetch import AsyncFetcher
+        
+        logging.info(f"Starting async crawl from {self.start_url}")
+        logging.info(f"Maximum pages: {self.max_pages}")
+        
+        fetcher = AsyncFetcher(max_concurrency=self.max_workers, per_host_concurrency=per_host_concurrency,
+                               rate_per_host=1 / self.delay if self.delay else None,
+                               timeout=timeout, max_retries=max_retries, headers=self.headers)
+        self.frontier.push(self.start_url, 0)
+        fetcher.run(self.frontier, self.handle_fetched_page, self.max_pages,
+                    accept=lambda url, depth: depth <= self.max_depth and self.claim_url(url))
         
         # Save metadata to Excel
         self.save_metadata()
@@ -262,9 +352,13 @@ def main():
     parser.add_argument('url', help='Starting URL to crawl')
     parser.add_argument('--output', '-o', default='downloaded_pdfs', help='Output folder for PDFs')
     parser.add_argument('--max-pages', '-m', type=int, default=100, help='Maximum number of pages to crawl')
-    parser.add_argument('--delay', '-d', type=float, default=1.0, help='Delay between requests (seconds)')
+    parser.add_argument('--delay', '-d', type=float, default=1.0, help='Delay between requests to the same host (seconds)')
     parser.add_argument('--depth', type=int, default=5, help='Maximum depth to crawl')
     parser.add_argument('--same-domain', action='store_true', help='Only crawl within the same domain')
+    parser.add_argument('--workers', '-w', type=int, default=5, help='Pages fetched concurrently')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Use the asyncio fetch engine (requires aiohttp); allows a much larger --workers')
+    parser.add_argument('--per-host', type=int, default=4, help='Concurrent requests per host with --async')
     
     args = parser.parse_args()
     
@@ -274,10 +368,14 @@ def main():
         max_pages=args.max_pages,
         delay=args.delay,
         max_depth=args.depth,
-        same_domain_only=args.same_domain
+        same_domain_only=args.same_domain,
+        max_workers=args.workers
     )
     
-    scraper.crawl()
+    if args.use_async:
+        scraper.crawl_async(per_host_concurrency=args.per_host)
+    else:
+        scraper.crawl()
 
 if __name__ == "__main__":
     main()
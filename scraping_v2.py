@@ -1,15 +1,18 @@
 import os
-import requests
 import pandas as pd
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
 from fpdf import FPDF
 import time
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
 import re
+from crawl_frontier import CrawlFrontier
+from http_session import PooledSession
 
 class WebDocExtractor:
-    def __init__(self, start_url, output_dir="extracted_docs", max_pages=50, depth_limit=3):
+    def __init__(self, start_url, output_dir="extracted_docs", max_pages=50, depth_limit=3,
+                 max_workers=5, priority=None, session=None):
         """
         Initialize the web document extractor
         
@@ -18,17 +21,26 @@ class WebDocExtractor:
             output_dir (str): Directory to save PDFs and metadata
             max_pages (int): Maximum number of pages to extract
             depth_limit (int): Maximum recursion depth
+            max_workers (int): Number of pages fetched concurrently
+            priority: Frontier order: None (breadth-first), "depth" or a
+                score(url, depth) callable, lower first (see CrawlFrontier)
+            session (PooledSession): Keep-alive session to fetch with; by default one
+                with a per-host pool of max_workers connections
         """
         self.start_url = start_url
         self.base_domain = urlparse(start_url).netloc
         self.output_dir = output_dir
         self.max_pages = max_pages
         self.depth_limit = depth_limit
+        self.max_workers = max_workers
         self.visited_urls = set()
+        self.frontier = CrawlFrontier(priority)
         self.extracted_docs = []
+        self._lock = threading.Lock()
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
+        self.session = session or PooledSession(pool_maxsize=max_workers, headers=self.headers)
         
         # Create output directory if it doesn't exist
         if not os.path.exists(output_dir):
@@ -114,26 +126,41 @@ class WebDocExtractor:
         pdf.output(full_path)
         return full_path
     
+    def claim_url(self, url, depth):
+        """Mark a URL as visited if it is within limits and not taken by another worker"""
+        with self._lock:
+            if url in self.visited_urls or len(self.extracted_docs) >= self.max_pages or depth > self.depth_limit:
+                return False
+            self.visited_urls.add(url)
+            return True
+    
     def crawl_url(self, url, depth=0):
-        """Crawl a URL and extract document content"""
+        """Crawl a URL, extract its document content and return the (url, depth) links to follow"""
         # Check if we've reached limits
-        if url in self.visited_urls or len(self.extracted_docs) >= self.max_pages or depth > self.depth_limit:
-            return
+        if not self.claim_url(url, depth):
+            return []
         
         print(f"Crawling: {url} (depth: {depth})")
-        self.visited_urls.add(url)
         
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = self.session.get(url, timeout=10)
             if response.status_code != 200:
-                return
+                return []
+            return self.process_page(url, depth, response.text)
             
+        except Exception as e:
+            print(f"Error processing {url}: {str(e)}")
+            return []
+    
+    def process_page(self, url, depth, html_content):
+        """Turn a fetched page into a PDF and return the (url, depth) links to follow"""
+        try:
             # Parse HTML content
-            soup = BeautifulSoup(response.text, 'html.parser')
+            soup = BeautifulSoup(html_content, 'html.parser')
             title = soup.title.string if soup.title else "Untitled"
             
             # Extract text content
-            content = self.extract_text_from_html(response.text)
+            content = self.extract_text_from_html(html_content)
             
             # Generate filename
             filename = self.clean_filename(title) + ".pdf"
@@ -142,42 +169,67 @@ class WebDocExtractor:
             pdf_path = self.create_pdf(title, content, filename)
             
             # Add to extracted documents
-            self.extracted_docs.append({
-                'title': title,
-                'url': url,
-                'filename': filename,
-                'path': pdf_path
-            })
+            with self._lock:
+                self.extracted_docs.append({
+                    'title': title,
+                    'url': url,
+                    'filename': filename,
+                    'path': pdf_path
+                })
             
-            # Find links for recursive crawling
-            if depth < self.depth_limit and len(self.extracted_docs) < self.max_pages:
-                links = soup.find_all('a', href=True)
-                new_urls = []
-                
-                for link in links:
-                    href = link['href']
+            # Find links to follow; the frontier drops ones already queued
+            new_urls = []
+            if depth < self.depth_limit:
+                for link in soup.find_all('a', href=True):
                     # Convert relative URLs to absolute
-                    absolute_url = urljoin(url, href)
-                    
-                    if (self.is_valid_url(absolute_url) and 
-                        absolute_url not in self.visited_urls and
-                        len(self.extracted_docs) < self.max_pages):
+                    absolute_url = urljoin(url, link['href'])
+                    if self.is_valid_url(absolute_url):
                         new_urls.append((absolute_url, depth + 1))
-                
-                # Process new URLs with thread pool for faster execution
-                with ThreadPoolExecutor(max_workers=5) as executor:
-                    for new_url, new_depth in new_urls:
-                        executor.submit(self.crawl_url, new_url, new_depth)
+            return new_urls
             
         except Exception as e:
             print(f"Error processing {url}: {str(e)}")
+            return []
+    
+    def crawl(self):
+        """Crawl from the start URL, keeping up to max_workers pages in flight"""
+        self.frontier.push(self.start_url, 0)
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while self.frontier or in_flight:
+                while (self.frontier and len(in_flight) < self.max_workers
+                       and len(self.extracted_docs) + len(in_flight) < self.max_pages):
+                    url, depth = self.frontier.pop()
+                    in_flight.add(executor.submit(self.crawl_url, url, depth))
+                if not in_flight:
+                    break
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.frontier.extend(future.result())
+    
+    def crawl_async(self, per_host_concurrency=4, rate_per_host=None, timeout=10, max_retries=3):
+        """
+        Crawl with the asyncio fetch engine (async_fetch.AsyncFetcher, needs aiohttp):
+        max_workers requests in flight without a thread each, retries with backoff on
+        429/5xx, and parsing plus PDF creation in a thread pool
+        """
+        from async_fetch import AsyncFetcher
+        
+        fetcher = AsyncFetcher(max_concurrency=self.max_workers, per_host_concurrency=per_host_concurrency,
+                               rate_per_host=rate_per_host, timeout=timeout, max_retries=max_retries,
+                               headers=self.headers)
+        self.frontier.push(self.start_url, 0)
+        fetcher.run(self.frontier, self.process_page, self.max_pages, accept=self.claim_url)
     
-    def extract_documents(self):
+    def extract_documents(self, use_async=False):
         """Main method to extract documents from URLs"""
         start_time = time.time()
         
-        # Start crawling from the initial URL
-        self.crawl_url(self.start_url)
+        # Crawl from the initial URL
+        if use_async:
+            self.crawl_async()
+        else:
+            self.crawl()
         
         # Create Excel metadata file
         if self.extracted_docs:
@@ -188,6 +240,8 @@ class WebDocExtractor:
         
         elapsed_time = time.time() - start_time
         print(f"Extraction completed. Processed {len(self.visited_urls)} URLs, extracted {len(self.extracted_docs)} documents in {elapsed_time:.2f} seconds")
+        if not use_async:
+            print(f"Connections: {self.session.format_stats()}")
         return self.extracted_docs
 
 # Example usage
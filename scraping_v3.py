@@ -7,9 +7,10 @@ import time
 import re
 from concurrent.futures import ThreadPoolExecutor
 from playwright.sync_api import sync_playwright
+from crawl_frontier import CrawlFrontier
 
 class WebDocExtractor:
-    def __init__(self, start_url, output_dir="extracted_docs", max_pages=50, depth_limit=3):
+    def __init__(self, start_url, output_dir="extracted_docs", max_pages=50, depth_limit=3, priority=None):
         """
         Initialize the web document extractor using Playwright
         
@@ -18,6 +19,8 @@ class WebDocExtractor:
             output_dir (str): Directory to save PDFs and metadata
             max_pages (int): Maximum number of pages to extract
             depth_limit (int): Maximum recursion depth
+            priority: Frontier order: None (breadth-first), "depth" or a
+                score(url, depth) callable, lower first (see CrawlFrontier)
         """
         self.start_url = start_url
         self.base_domain = urlparse(start_url).netloc
@@ -25,6 +28,7 @@ class WebDocExtractor:
         self.max_pages = max_pages
         self.depth_limit = depth_limit
         self.visited_urls = set()
+        self.frontier = CrawlFrontier(priority)
         self.extracted_docs = []
         self.playwright = None
         self.browser = None
@@ -127,10 +131,10 @@ class WebDocExtractor:
         return full_path
     
     def crawl_url(self, url, depth=0):
-        """Crawl a URL and extract document content using Playwright"""
+        """Crawl a URL with Playwright, extract its document content and return the (url, depth) links to follow"""
         # Check if we've reached limits
         if url in self.visited_urls or len(self.extracted_docs) >= self.max_pages or depth > self.depth_limit:
-            return
+            return []
         
         print(f"Crawling: {url} (depth: {depth})")
         self.visited_urls.add(url)
@@ -188,12 +192,12 @@ class WebDocExtractor:
                 # Close the page
                 page.close()
                 
-                # Process new URLs sequentially to avoid overwhelming the browser
-                for new_url, new_depth in new_urls[:10]:  # Limit batch size
-                    self.crawl_url(new_url, new_depth)
+                # Follow a limited number of links per page to avoid overwhelming the browser
+                return new_urls[:10]
             else:
                 # Close the page
                 page.close()
+                return []
             
         except Exception as e:
             print(f"Error processing {url}: {str(e)}")
@@ -202,13 +206,21 @@ class WebDocExtractor:
                 page.close()
             except:
                 pass
+            return []
+    
+    def crawl(self):
+        """Crawl from the start URL one page at a time (the sync Playwright API is single-threaded)"""
+        self.frontier.push(self.start_url, 0)
+        while self.frontier and len(self.extracted_docs) < self.max_pages:
+            url, depth = self.frontier.pop()
+            self.frontier.extend(self.crawl_url(url, depth))
     
     def extract_documents(self):
         """Main method to extract documents from URLs"""
         start_time = time.time()
         
-        # Start crawling from the initial URL
-        self.crawl_url(self.start_url)
+        # Crawl from the initial URL
+        self.crawl()
         
         # Create Excel metadata file
         if self.extracted_docs: